@@ -0,0 +1,321 @@
+"""
+Benchmark offline del bot su un corpus sintetico di pagine IPZS/MTM.
+
+    python bench/run_bench.py                       # tutti i backend, tabella + JSON
+    python bench/run_bench.py --backend lxml --out bench/results.json
+    python bench/run_bench.py --baseline bench/baseline.json
+    python bench/run_bench.py --check               # equivalenza dei backend con l'estrazione originale
+
+Le richieste HTTP sono servite dal corpus tramite un adapter requests montato
+sulla sessione del motore di fetch: nessuna chiamata di rete, nessuna scrittura
+nello stato del repo (si lavora in una directory temporanea).
+
+Il corpus è sintetico: pagine costruite sul markup Magento/OpenCart che i
+parser si aspettano, con URL inventate in index.json (non riscaricabili).
+Per una struttura nuova del sito si aggiunge a mano una pagina e la sua voce.
+"""
+import io
+import os
+import sys
+import json
+import math
+import time
+import re
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import contextlib
+from statistics import mean, median
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS = os.path.join(ROOT, "bench", "corpus")
+sys.path.insert(0, ROOT)
+
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+import ipzs
+import mtm
+import extract
+import product
+from fetch import engine
+from http_cache import canonical_url
+
+
+# ──────────────── Corpus
+def load_corpus():
+    with open(os.path.join(CORPUS, "index.json"), encoding="utf-8") as f:
+        index = json.load(f)
+    pages = []
+    for fn, meta in sorted(index.items()):
+        with open(os.path.join(CORPUS, fn), "rb") as f:
+            pages.append({"file": fn, "kind": meta["kind"], "url": meta["url"], "content": f.read()})
+    return pages
+
+
+class CorpusAdapter(HTTPAdapter):
+    """Risponde alle GET con le pagine del corpus (404 per il resto)."""
+
+    def __init__(self, pages):
+        super().__init__()
+        self.pages = {canonical_url(p["url"]): p["content"] for p in pages}
+
+    def send(self, request, **kwargs):
+        body = self.pages.get(canonical_url(request.url))
+        r = requests.Response()
+        r.status_code = 200 if body is not None else 404
+        r._content = body or b""
+        r.raw = io.BytesIO(r._content)      # per le letture in streaming (sitemap)
+        r.url = request.url
+        r.request = request
+        r.encoding = "utf-8"
+        r.headers["Content-Type"] = "text/html; charset=utf-8"
+        return r
+
+
+class NullCache:
+    """Cache HTTP disattivata: ogni chiamata misura fetch + parsing reali."""
+
+    def validators(self, url):
+        return {}
+
+    def lookup(self, url, kind, r):
+        return False, None
+
+    def parsed(self, url, kind):
+        return None
+
+    def store(self, url, kind, r, parsed):
+        pass
+
+    def save(self):
+        pass
+
+
+# ──────────────── Equivalenza backend
+def reference_product(url, content):
+    """Estrazione di scrape_ipzs prima dei backend (BeautifulSoup sull'intera pagina)."""
+    soup = BeautifulSoup(content, "html.parser")
+    info = {"link": url}
+    title_el = soup.select_one("h1.page-title span.base")
+    if not title_el:
+        return None
+    info["nome"] = title_el.get_text(strip=True)
+    pr = soup.select_one("span.price")
+    info["prezzo"] = pr.get_text(strip=True) if pr else "N/A"
+
+    stock = soup.select_one("div.stock")
+    raw = stock.get_text(strip=True).upper() if stock else ""
+    info["disponibilita"] = (
+        "NON DISPONIBILE" if "NON DISPONIBILE" in raw else
+        "DISPONIBILE"     if "DISPONIBILE"     in raw else
+        raw or "N/A"
+    )
+
+    attrs = {}
+    for tr in soup.select("div.product-info-main table.data tr"):
+        th, td = tr.find("th"), tr.find("td")
+        if th and td:
+            attrs[th.get_text(strip=True).lower()] = td.get_text(strip=True)
+
+    info["contingente"]        = attrs.get("contingente") or attrs.get("tiratura") or attrs.get("numero pezzi","N/A")
+    info["data disponibilita"] = attrs.get("data disponibilità") or attrs.get("data disponibilita","N/A")
+    info["finitura"]           = attrs.get("finitura","N/A")
+    info["metallo"]            = attrs.get("metallo","N/A")
+    info["peso (gr)"]          = attrs.get("peso (gr)","N/A")
+    info["in vendita da"]      = attrs.get("in vendita da","N/A")
+    return info
+
+
+def reference_links(content):
+    soup = BeautifulSoup(content, "html.parser")
+    return [a["href"] for a in soup.select("a.product-item-link") if a.get("href")]
+
+
+def reference_thumbs(content):
+    soup = BeautifulSoup(content, "html.parser")
+    out = []
+    for block in soup.select(".product-thumb"):
+        a_tag     = block.find("a", href=True)
+        title_tag = block.select_one("h4")
+        price_tag = block.select_one(".price")
+        if not a_tag or not title_tag:
+            continue
+        out.append((
+            a_tag["href"],
+            title_tag.get_text(strip=True),
+            price_tag.get_text(strip=True) if price_tag else None,
+        ))
+    return out
+
+
+def latin1(page):
+    """Variante ISO-8859-1 di una pagina del corpus, per i backend che assumono UTF-8."""
+    text = page["content"].decode("utf-8")
+    text = re.sub(r"(<meta\b[^>]*charset=[\"']?)[\w-]+", r"\1iso-8859-1", text, count=1, flags=re.I)
+    return {**page, "file": page["file"] + " (latin-1)",
+            "content": text.encode("latin-1", "xmlcharrefreplace")}
+
+
+def check(backends):
+    """Confronta ogni backend con l'estrazione originale su tutto il corpus. Ritorna le differenze."""
+    pages = load_corpus()
+    pages += [latin1(p) for p in pages]
+    checks = {
+        "ipzs_product":  lambda b, p: (b.product(p["url"], p["content"]), reference_product(p["url"], p["content"])),
+        "ipzs_category": lambda b, p: (b.product_links(p["content"]), reference_links(p["content"])),
+        "mtm_category":  lambda b, p: (b.mtm_thumbs(p["content"]), reference_thumbs(p["content"])),
+    }
+    diffs = []
+    for name in backends:
+        backend = extract.get_backend(name)
+        for p in pages:
+            if p["kind"] not in checks:
+                continue
+            got, want = checks[p["kind"]](backend, p)
+            if got != want:
+                diffs.append((name, p["file"], got, want))
+    return diffs
+
+
+# ──────────────── Misura
+def measure(fn, inputs, rounds):
+    """Latenze per chiamata (ns) su `rounds` giri e picco di memoria di un giro."""
+    for x in inputs:          # warm-up
+        fn(x)
+    lat = []
+    for _ in range(rounds):
+        for x in inputs:
+            t = time.perf_counter_ns()
+            fn(x)
+            lat.append(time.perf_counter_ns() - t)
+
+    tracemalloc.start()
+    for x in inputs:
+        fn(x)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    lat.sort()
+    total_s = sum(lat) / 1e9
+    return {
+        "calls":         len(lat),
+        "mean_us":       round(mean(lat) / 1e3, 2),
+        "p50_us":        round(median(lat) / 1e3, 2),
+        # nearest-rank: con pochi campioni int(n * 0.95) - 1 cadeva sotto il p95
+        "p95_us":        round(lat[math.ceil(len(lat) * 0.95) - 1] / 1e3, 2),
+        "throughput_s":  round(len(lat) / total_s, 1) if total_s else None,
+        "peak_mem_kb":   round(peak / 1024, 1),
+    }
+
+
+def cases(pages):
+    by_kind = {}
+    for p in pages:
+        by_kind.setdefault(p["kind"], []).append(p)
+
+    categories = by_kind["ipzs_category"]
+    products   = by_kind["ipzs_product"]
+    mtm_pages  = by_kind["mtm_category"]
+    parsed     = [ipzs.scrape_ipzs(p["url"]) for p in products]
+    parsed     = [p for p in parsed if p]
+
+    def mtm_loop(content):
+        return [
+            (link, title, price)
+            for link, title, price in extract.mtm_thumbs(content)
+            if mtm.is_mtm_target(title)
+        ]
+
+    return [
+        ("get_links",          lambda p: ipzs.get_links(p["url"]),         categories),
+        ("scrape_ipzs",        lambda p: ipzs.scrape_ipzs(p["url"]),       products),
+        ("is_valid_ipzs_page", lambda p: ipzs.is_valid_ipzs_page(p["content"]), pages),
+        ("parse_tiratura",     lambda p: product.parse_tiratura(p["contingente"]),        parsed),
+        ("parse_price",        lambda p: product.parse_price(p["prezzo"]),                parsed),
+        ("parse_date",         lambda p: product.parse_date(p["data disponibilita"]),     parsed),
+        ("should_flash_cart",  ipzs.should_flash_cart,                                 parsed),
+        ("mtm_product_thumb",  lambda p: mtm_loop(p["content"]),                       mtm_pages),
+        ("sweep_ipzs",         lambda urls: engine.run(ipzs.sweep_ipzs(urls, fingerprint=False)),
+                               [[p["url"] for p in categories]]),
+    ]
+
+
+def run(backends, rounds):
+    pages = load_corpus()
+    engine.session.mount("https://", CorpusAdapter(pages))
+    engine.session.mount("http://", CorpusAdapter(pages))
+    ipzs.cache = NullCache()
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python":    platform.python_version(),
+            "machine":   platform.machine(),
+            "rounds":    rounds,
+            "corpus":    len(pages),
+        },
+        "results": {},
+    }
+
+    # stato e cache scritti dal bot restano fuori dal repo
+    # i print del bot vanno su stderr per non sporcare il JSON su stdout
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(sys.stderr):
+        os.chdir(tmp)
+        try:
+            for name in backends:
+                extract.backend = extract.get_backend(name)
+                for case, fn, inputs in cases(pages):
+                    results["results"][f"{name}:{case}"] = measure(fn, inputs, rounds)
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def report(results, baseline=None):
+    base = (baseline or {}).get("results", {})
+    print(f"{'benchmark':<28}{'mean µs':>12}{'p95 µs':>12}{'calls/s':>12}{'peak KB':>10}{'vs base':>10}", file=sys.stderr)
+    for key, r in results["results"].items():
+        ratio = ""
+        if key in base and base[key]["mean_us"]:
+            ratio = f"{r['mean_us'] / base[key]['mean_us']:.2f}x"
+        print(
+            f"{key:<28}{r['mean_us']:>12}{r['p95_us']:>12}{r['throughput_s']:>12}{r['peak_mem_kb']:>10}{ratio:>10}",
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--backend", default="all", help="soup | lxml | all")
+    ap.add_argument("--rounds", type=int, default=20)
+    ap.add_argument("--out", help="file JSON dei risultati (default: stdout)")
+    ap.add_argument("--baseline", help="JSON di un run precedente da confrontare")
+    ap.add_argument("--check", action="store_true", help="solo equivalenza dei backend, exit 1 se differiscono")
+    args = ap.parse_args()
+
+    backends = list(extract.BACKENDS) if args.backend == "all" else [args.backend]
+
+    if args.check:
+        diffs = check(backends)
+        for name, fn, got, want in diffs:
+            print(f"❌ {name} {fn}:\n   backend:    {got}\n   originale:  {want}")
+        print(f"{'❌' if diffs else '✅'} Equivalenza backend {', '.join(backends)}: {len(diffs)} differenze")
+        sys.exit(1 if diffs else 0)
+    results = run(backends, args.rounds)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    report(results, baseline)
+
+    payload = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
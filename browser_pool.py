@@ -0,0 +1,173 @@
+import os
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+
+from mtm_flash import setup_driver_headless
+from metrics import metrics
+
+# ──────────────── Config pool Chromium
+MAX_PER_KEY   = 2          # driver contemporanei per (shop, account)
+MAX_USES      = 25         # dopo N utilizzi il driver viene riciclato
+MAX_AGE       = 45 * 60    # età massima driver (s)
+SPAWN_RETRIES = 3
+SPAWN_BACKOFF = 2          # s, moltiplicato per il tentativo
+LOGIN_RETRIES = 2          # login fallito → driver nuovo e secondo tentativo
+
+
+class PooledDriver:
+    def __init__(self, driver):
+        self.driver  = driver
+        self.created = time.monotonic()
+        self.uses    = 0
+
+    def expired(self):
+        return self.uses >= MAX_USES or time.monotonic() - self.created > MAX_AGE
+
+    def alive(self):
+        try:
+            self.driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+
+
+class BrowserPool:
+    """
+    Pool di Chromium headless già loggati, per chiave (shop, account).
+    Ogni driver ha la sua porta di debug, quindi più driver convivono;
+    quelli morti, troppo vecchi o troppo usati vengono sostituiti.
+    """
+
+    def __init__(self, max_per_key=MAX_PER_KEY):
+        self.max_per_key = max_per_key
+        self.cond  = threading.Condition()
+        self.idle  = {}   # key → [PooledDriver]
+        self.total = {}   # key → driver vivi (idle + in uso)
+        self.closed = False
+
+    # ─────────── Avvio + login
+    def _spawn(self, key, login):
+        for attempt in range(1, SPAWN_RETRIES + 1):
+            try:
+                with metrics.phase("browser_start"):
+                    driver = setup_driver_headless()
+                break
+            except Exception as e:
+                print(f"⚠️ [{key[0]}] Chrome startup fallito #{attempt}: {e}")
+                time.sleep(SPAWN_BACKOFF * attempt)
+        else:
+            return None
+
+        pooled = PooledDriver(driver)
+        try:
+            with metrics.phase("login"):
+                ok = login(driver)
+        except Exception as e:
+            print(f"❌ [{key[0]}] errore login: {e}")
+            ok = False
+        if not ok:
+            pooled.quit()
+            return None
+        return pooled
+
+    def _reserve(self, key):
+        # prende un driver idle sano o riserva uno slot per crearne uno nuovo
+        with self.cond:
+            while True:
+                idle = self.idle.setdefault(key, [])
+                while idle:
+                    pooled = idle.pop()
+                    if not pooled.expired() and pooled.alive():
+                        return pooled
+                    pooled.quit()
+                    self.total[key] -= 1
+                if self.total.get(key, 0) < self.max_per_key:
+                    self.total[key] = self.total.get(key, 0) + 1
+                    return None
+                self.cond.wait()
+
+    def _unreserve(self, key):
+        with self.cond:
+            self.total[key] -= 1
+            self.cond.notify()
+
+    def acquire(self, key, login):
+        """Ritorna un driver loggato per `key` oppure None se avvio/login falliscono."""
+        pooled = self._reserve(key)
+        if pooled is None:
+            for _ in range(LOGIN_RETRIES):
+                pooled = self._spawn(key, login)
+                if pooled:
+                    break
+            if pooled is None:
+                self._unreserve(key)
+                return None
+        pooled.uses += 1
+        return pooled
+
+    def release(self, key, pooled, healthy=True):
+        with self.cond:
+            if healthy and not self.closed and not pooled.expired():
+                self.idle.setdefault(key, []).append(pooled)
+            else:
+                pooled.quit()
+                self.total[key] -= 1
+            self.cond.notify()
+
+    @contextmanager
+    def session(self, key, login):
+        pooled = self.acquire(key, login)
+        if pooled is None:
+            yield None
+            return
+        healthy = True
+        try:
+            yield pooled.driver
+        except Exception:
+            healthy = False
+            raise
+        finally:
+            self.release(key, pooled, healthy=healthy and pooled.alive())
+
+    def prewarm(self, key, login, n=1):
+        """Avvia e logga in background fino a n driver idle per `key`."""
+        def warm():
+            pooled = self.acquire(key, login)
+            if pooled:
+                pooled.uses -= 1
+                self.release(key, pooled)
+                print(f"🔥 Driver pre-riscaldato: {key[0]} {key[1] or ''}")
+
+        with self.cond:
+            missing = n - len(self.idle.get(key, []))
+        for _ in range(max(0, missing)):
+            threading.Thread(target=warm, daemon=True).start()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            for key, idle in self.idle.items():
+                for pooled in idle:
+                    pooled.quit()
+                    self.total[key] -= 1
+            self.idle.clear()
+
+
+def ipzs_key():
+    return ("ipzs", os.getenv("IPZS_USERNAME"))
+
+
+def mtm_key(user):
+    return ("mtm", user)
+
+
+pool = BrowserPool()
+atexit.register(pool.close)
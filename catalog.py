@@ -0,0 +1,93 @@
+import os
+import json
+from datetime import datetime, timedelta
+
+from state import open_store
+from product import Product
+
+# ──────────────── Snapshot catalogo IPZS condiviso (main, flash runner, sniper)
+FORMAT  = 1                                                    # formato del JSON prodotti
+MAX_AGE = timedelta(minutes=int(os.getenv("CATALOG_MAX_AGE_MIN", "15")))
+KEEP    = 5                                                    # snapshot conservati
+
+# copertura dello sweep, dalla più ristretta: uno snapshot vale per chi chiede
+# una copertura uguale o minore (main non si accontenta delle sole categorie)
+COVERAGE = ("categories", "sitemap", "spider")
+
+
+class Snapshot:
+    """Prodotti IPZS di uno sweep, con versione e istante di acquisizione."""
+
+    __slots__ = ("version", "taken_at", "source", "coverage", "products")
+
+    def __init__(self, version, taken_at, source, coverage, products):
+        self.version  = version
+        self.taken_at = taken_at
+        self.source   = source
+        self.coverage = coverage
+        self.products = products
+
+    @property
+    def age(self):
+        return datetime.now() - self.taken_at
+
+    def fresh(self, max_age=MAX_AGE):
+        return self.age <= max_age
+
+    def by_link(self):
+        return {p.link: p for p in self.products}
+
+
+def publish(products, source, coverage="categories"):
+    """Scrive un nuovo snapshot (e tiene solo gli ultimi KEEP)."""
+    store = open_store()
+    taken_at = datetime.now()
+    payload = json.dumps(
+        {"format": FORMAT, "coverage": coverage, "products": [p.to_dict() for p in products]},
+        ensure_ascii=False,
+    )
+    store.execute(
+        "INSERT INTO catalog(taken_at, source, products) VALUES (?, ?, ?)",
+        (taken_at.isoformat(), source, payload),
+    )
+    version = store.query_one("SELECT MAX(version) FROM catalog")[0]
+    store.execute("DELETE FROM catalog WHERE version <= ?", (version - KEEP,))
+    print(f"🗂️ Snapshot catalogo v{version} ({source}, {coverage}): {len(products)} prodotti")
+    return Snapshot(version, taken_at, source, coverage, list(products))
+
+
+def latest(coverage="categories"):
+    """Snapshot più recente con almeno la copertura richiesta, o None."""
+    rows = open_store().query(
+        "SELECT version, taken_at, source, products FROM catalog ORDER BY version DESC"
+    )
+    for version, taken_at, source, payload in rows:
+        data = json.loads(payload)
+        if data.get("format") != FORMAT:
+            print(f"⚠️ Snapshot catalogo v{version} in formato {data.get('format')}: ignorato")
+            continue
+        snap_coverage = data.get("coverage", "categories")
+        if COVERAGE.index(snap_coverage) < COVERAGE.index(coverage):
+            continue
+        products = [Product.from_dict(d) for d in data["products"]]
+        return Snapshot(version, datetime.fromisoformat(taken_at), source, snap_coverage, products)
+    return None
+
+
+def current(produce, source, max_age=MAX_AGE, coverage="categories"):
+    """
+    Ultimo snapshot con copertura ≥ `coverage` se più giovane di `max_age`,
+    altrimenti `produce()` (uno sweep con quella copertura) genera i prodotti
+    e diventa il nuovo snapshot per tutti.
+    """
+    snap = latest(coverage)
+    if snap and snap.fresh(max_age):
+        print(f"🗂️ Snapshot catalogo v{snap.version} ({snap.source}, {snap.coverage}, "
+              f"{snap.age.total_seconds():.0f}s fa)")
+        return snap
+    products = produce()
+    if not products:
+        # sweep bloccato o vuoto: meglio lo snapshot vecchio che nessuno
+        print("⚠️ Sweep catalogo vuoto: snapshot non aggiornato")
+        return snap
+    return publish(products, source, coverage)
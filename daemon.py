@@ -0,0 +1,201 @@
+import os
+import time
+import signal
+import threading
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import mtm
+import sniper_ipzs
+from state import open_store
+from http_cache import cache
+from utils import outbox, sunday_ping
+from metrics import metrics
+from release import ReleaseScheduler
+from shops import SHOPS, IPZS, MTM
+from browser_pool import pool, ipzs_key, mtm_key
+
+# ──────────────── Config daemon
+TZ = ZoneInfo("Europe/Rome")
+
+NIGHT_HOURS  = range(0, 7)   # ore locali "tranquille"
+NIGHT_FACTOR = 4             # intervalli ×4 di notte
+RELEASE_WINDOW = timedelta(hours=24)
+COOLDOWN     = 1.5           # dopo un giro "caldo" l'intervallo risale di ×1.5 per giro
+TICK         = 1.0           # risoluzione scheduler (s)
+
+
+class Job:
+    """
+    Job ricorrente con intervallo adattivo: `fn` ritorna True se il giro è
+    stato "caldo" (stock cambiato, uscita vicina) e l'intervallo scende al
+    minimo, altrimenti risale gradualmente fino a quello base.
+    """
+
+    def __init__(self, name, fn, base, min_interval=None, max_interval=None, lock=None):
+        self.name     = name
+        self.fn       = fn
+        self.base     = base
+        self.min      = min_interval or base
+        self.max      = max_interval or base * NIGHT_FACTOR
+        self.interval = base
+        self.next_run = time.monotonic()
+        self.running  = False
+        self.lock     = lock  # job con lo stesso lock non si sovrappongono
+
+    def effective_interval(self, now=None):
+        now = now or datetime.now(TZ)
+        interval = self.interval
+        if now.hour in NIGHT_HOURS:
+            interval *= NIGHT_FACTOR
+        return max(self.min, min(interval, self.max))
+
+    def adapt(self, hot):
+        if hot:
+            self.interval = self.min
+        else:
+            self.interval = min(self.base, self.interval * COOLDOWN)
+        self.next_run = time.monotonic() + self.effective_interval()
+
+
+class Scheduler:
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.stop = threading.Event()
+
+    def _run(self, job):
+        started = time.monotonic()
+        hot = False
+        try:
+            hot = bool(job.fn())
+        except Exception as e:
+            print(f"❌ Job {job.name} fallito: {e}")
+        finally:
+            if job.lock:
+                job.lock.release()
+            job.adapt(hot)
+            job.running = False
+            # contatori cumulativi dall'avvio del daemon, una riga JSONL per giro
+            metrics.write("daemon", job=job.name, job_s=round(time.monotonic() - started, 3), hot=hot)
+            print(
+                f"⏱️ {job.name} in {time.monotonic() - started:.1f}s "
+                f"{'🔥' if hot else ''}→ prossimo tra {job.effective_interval():.0f}s"
+            )
+
+    def loop(self):
+        while not self.stop.is_set():
+            now = time.monotonic()
+            for job in self.jobs:
+                if job.running or job.next_run > now:
+                    continue
+                if job.lock and not job.lock.acquire(blocking=False):
+                    continue
+                job.running = True
+                threading.Thread(target=self._run, args=(job,), name=job.name, daemon=True).start()
+            self.stop.wait(TICK)
+
+
+# ──────────────── Job del bot (stato e sessioni restano in memoria tra i giri)
+_last_stock = {}
+_releases   = ReleaseScheduler()
+
+
+def _release_near(prods):
+    now = datetime.now()
+    for p in prods:
+        d = p.release
+        if d and now - timedelta(hours=1) <= d <= now + RELEASE_WINDOW:
+            return True
+    return False
+
+
+def ipzs_job():
+    # il daemon è il produttore dello snapshot: sweep a ogni giro
+    prods = IPZS.run(with_spider=False, max_age=timedelta(0))
+    flipped = [
+        p.link for p in prods
+        if p.link in _last_stock and _last_stock[p.link] is not p.availability
+    ]
+    _last_stock.update({p.link: p.availability for p in prods})
+    # burst sulle uscite delle prossime 24h (browser pre-riscaldato + polling mirato)
+    _releases.plan(prods)
+    if flipped:
+        print(f"🔁 Stock cambiato su {len(flipped)} prodotti")
+    return bool(flipped) or _release_near(prods)
+
+
+def spider_job():
+    IPZS.run(with_spider=True)
+    return False
+
+
+def shop_job(shop):
+    # shop senza job dedicati (MTM e i prossimi): giro completo dell'adapter
+    def job():
+        shop.run()
+        return False
+    return job
+
+
+def sniper_job():
+    # stesso state store del giro IPZS: lo sniper usa lo snapshot catalogo
+    sniper_ipzs.main(use_snapshot=True)
+    return False
+
+
+def ping_job():
+    sunday_ping()
+    return False
+
+
+def build_jobs():
+    # sweep e spider condividono notifiche e flash-cart IPZS: mai in parallelo
+    ipzs = threading.Lock()
+    return [
+        Job("ipzs",   ipzs_job,   base=300,   min_interval=60,  lock=ipzs),
+        Job("sniper", sniper_job, base=360,   min_interval=180),
+        Job("spider", spider_job, base=43200, min_interval=43200, lock=ipzs),
+        Job("ping",   ping_job,   base=600,   min_interval=600, max_interval=600),
+    ] + [
+        Job(shop.name, shop_job(shop), base=300, min_interval=120)
+        for shop in SHOPS if shop.name != "ipzs"
+    ]
+
+
+def prewarm_browsers():
+    # driver loggati pronti nel pool: avvio Chromium e login fuori dal percorso al carrello
+    n = int(os.getenv("BROWSER_PREWARM", "1"))
+    if os.getenv("IPZS_USERNAME"):
+        pool.prewarm(ipzs_key(), sniper_ipzs.sniper_login, n)
+    for acct in mtm.MTM_ACCOUNTS:
+        user, pwd = acct["user"], acct["pwd"]
+        if user and pwd:
+            pool.prewarm(mtm_key(user), lambda d, user=user, pwd=pwd: MTM.login(d, user, pwd), n)
+
+
+def run_daemon():
+    print("🚀 Daemon avviato", datetime.now())
+    store = open_store()
+    outbox.start()
+    prewarm_browsers()
+    scheduler = Scheduler(build_jobs())
+
+    def shutdown(signum, frame):
+        print(f"🛑 Segnale {signum}: chiudo il daemon")
+        scheduler.stop.set()
+        _releases.stop.set()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    scheduler.loop()
+
+    store.export()
+    cache.save()
+    outbox.flush()
+    pool.close()
+    print("✅ Daemon terminato", datetime.now())
+
+
+if __name__ == "__main__":
+    run_daemon()
@@ -0,0 +1,391 @@
+import os
+import re
+import html as html_lib
+import threading
+
+from bs4 import BeautifulSoup, SoupStrainer, UnicodeDammit
+
+try:
+    from lxml import etree, html as lxml_html
+except ImportError:  # lxml opzionale: fallback su BeautifulSoup ristretto
+    lxml_html = None
+
+# ──────────────── Classificazione pagina (sui byte grezzi)
+BAD_SIGNALS = (
+    "queue-it",
+    "captcha",
+    "access denied",
+    "temporarily unavailable",
+)
+GOOD_SIGNALS = (
+    "product-item-link",
+    "page-title",
+    "catalog-product-view",
+    "catalog-category-view",
+    "product-addtocart-button",
+)
+_BAD  = tuple(s.encode() for s in BAD_SIGNALS)
+_GOOD = tuple(s.encode() for s in GOOD_SIGNALS)
+
+
+def is_valid(content):
+    """
+    Stessa semantica di is_valid_ipzs_page: nessun segnale di blocco
+    e almeno un marcatore IPZS. Lavora sui byte (niente decodifica di r.text):
+    bytes.lower() e le ricerche di sottostringa girano in C.
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8", "ignore")
+    low = content.lower()
+    if any(s in low for s in _BAD):
+        return False
+    return any(s in low for s in _GOOD)
+
+
+# ──────────────── Form add-to-cart Magento (regex sui byte, indipendente dal backend)
+_CART_FORM_RE = re.compile(
+    rb"<form\b[^>]*\bid=[\"']product_addtocart_form[\"'][^>]*>(.*?)</form>", re.I | re.S
+)
+_ACTION_RE  = re.compile(rb"\baction=[\"']([^\"']+)[\"']", re.I)
+_PRODUCT_ID_RE = re.compile(rb"/product/(\d+)")
+
+
+def _input_value(form, name):
+    for tag in re.finditer(rb"<input\b[^>]*>", form, re.I):
+        tag = tag.group()
+        if re.search(rb"\bname=[\"']" + name + rb"[\"']", tag, re.I):
+            m = re.search(rb"\bvalue=[\"']([^\"']*)[\"']", tag, re.I)
+            return m.group(1).decode() if m else None
+    return None
+
+
+def cart_form(content):
+    """
+    (action, form_key, product_id) del form #product_addtocart_form,
+    oppure None se la pagina non ha un form di acquisto.
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8", "ignore")
+    m = _CART_FORM_RE.search(content)
+    if not m:
+        return None
+    open_tag = content[m.start():m.start(1)]
+    action = _ACTION_RE.search(open_tag)
+    if not action:
+        return None
+    action = html_lib.unescape(action.group(1).decode())
+    form_key = _input_value(m.group(1), b"form_key")
+    product_id = _input_value(m.group(1), b"product")
+    if not product_id:
+        pid = _PRODUCT_ID_RE.search(action.encode())
+        product_id = pid.group(1).decode() if pid else None
+    if not form_key or not product_id:
+        return None
+    return action, form_key, product_id
+
+
+# ──────────────── Assemblaggio campi prodotto (comune ai backend)
+def _build_product(url, title, price, stock, attrs):
+    if title is None:
+        return None
+    raw = stock.upper() if stock is not None else ""
+    return {
+        "link":               url,
+        "nome":               title,
+        "prezzo":             price if price is not None else "N/A",
+        "disponibilita": (
+            "NON DISPONIBILE" if "NON DISPONIBILE" in raw else
+            "DISPONIBILE"     if "DISPONIBILE"     in raw else
+            raw or "N/A"
+        ),
+        "contingente":        attrs.get("contingente") or attrs.get("tiratura") or attrs.get("numero pezzi","N/A"),
+        "data disponibilita": attrs.get("data disponibilità") or attrs.get("data disponibilita","N/A"),
+        "finitura":           attrs.get("finitura","N/A"),
+        "metallo":            attrs.get("metallo","N/A"),
+        "peso (gr)":          attrs.get("peso (gr)","N/A"),
+        "in vendita da":      attrs.get("in vendita da","N/A"),
+    }
+
+
+def _classes(attrs):
+    cls = attrs.get("class") or ""
+    if isinstance(cls, (list, tuple)):
+        return cls
+    return cls.split()
+
+
+# ──────────────── Backend BeautifulSoup con SoupStrainer
+class SoupExtractor:
+    """
+    Fallback puro-Python: html.parser costruisce solo i sottoalberi
+    che servono (titolo, prezzo, stock, tabella attributi, card prodotto).
+    """
+
+    name = "soup"
+
+    @staticmethod
+    def _product_only(name, attrs):
+        cls = _classes(attrs)
+        return (
+            (name == "h1"   and "page-title" in cls)
+            or (name == "span" and "price" in cls)
+            or (name == "div"  and ("stock" in cls or "product-info-main" in cls))
+        )
+
+    @staticmethod
+    def _links_only(name, attrs):
+        return name == "a" and "product-item-link" in _classes(attrs)
+
+    @staticmethod
+    def _listing_only(name, attrs):
+        cls = _classes(attrs)
+        return "product-item" in cls or (name == "a" and "product-item-link" in cls)
+
+    @staticmethod
+    def _thumbs_only(name, attrs):
+        return "product-thumb" in _classes(attrs)
+
+    @staticmethod
+    def _page_only(name, attrs):
+        return name == "a" or (name == "h1" and "page-title" in _classes(attrs))
+
+    def product(self, url, content):
+        soup = BeautifulSoup(content, "html.parser", parse_only=SoupStrainer(self._product_only))
+        title_el = soup.select_one("h1.page-title span.base")
+        pr       = soup.select_one("span.price")
+        stock    = soup.select_one("div.stock")
+        attrs = {}
+        for tr in soup.select("div.product-info-main table.data tr"):
+            th, td = tr.find("th"), tr.find("td")
+            if th and td:
+                attrs[th.get_text(strip=True).lower()] = td.get_text(strip=True)
+        return _build_product(
+            url,
+            title_el.get_text(strip=True) if title_el else None,
+            pr.get_text(strip=True) if pr else None,
+            stock.get_text(strip=True) if stock else None,
+            attrs,
+        )
+
+    def product_links(self, content):
+        soup = BeautifulSoup(content, "html.parser", parse_only=SoupStrainer(self._links_only))
+        return [a["href"] for a in soup.find_all("a") if a.get("href")]
+
+    def listing(self, content):
+        soup = BeautifulSoup(content, "html.parser", parse_only=SoupStrainer(self._listing_only))
+        out = []
+        for a in soup.select("a.product-item-link"):
+            if not a.get("href"):
+                continue
+            item  = a.find_parent(class_="product-item")
+            price = item.select_one("span.price") if item else None
+            stock = item.select_one(".stock") if item else None
+            out.append((
+                a["href"],
+                price.get_text(strip=True) if price else "",
+                stock.get_text(strip=True).upper() if stock else "",
+            ))
+        return out
+
+    def page(self, content):
+        soup = BeautifulSoup(content, "html.parser", parse_only=SoupStrainer(self._page_only))
+        is_product = soup.select_one("h1.page-title span.base") is not None
+        return is_product, [a["href"] for a in soup.find_all("a", href=True)]
+
+    def mtm_thumbs(self, content):
+        soup = BeautifulSoup(content, "html.parser", parse_only=SoupStrainer(self._thumbs_only))
+        out = []
+        for block in soup.select(".product-thumb"):
+            a_tag     = block.find("a", href=True)
+            title_tag = block.select_one("h4")
+            price_tag = block.select_one(".price")
+            if not a_tag or not title_tag:
+                continue
+            out.append((
+                a_tag["href"],
+                title_tag.get_text(strip=True),
+                price_tag.get_text(strip=True) if price_tag else None,
+            ))
+        return out
+
+
+# ──────────────── Backend lxml (parser C + XPath precompilate)
+def _cls(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# come get_text() di soup: i nodi testo sotto script/style/template non contano
+# (e i commenti non sono text() per XPath), le code dei figli sì
+_TEXT = etree.XPath("descendant-or-self::text()[not(ancestor::script or ancestor::style or ancestor::template)]")
+
+
+def _text(el):
+    return "".join(t.strip() for t in _TEXT(el))
+
+
+_CHARSET_RE = re.compile(rb"<meta\b[^>]*charset=[\"']?([\w.:-]+)", re.I)
+
+
+def _is_utf8(content):
+    m = _CHARSET_RE.search(content, 0, 2048)
+    if m and m.group(1).lower() not in (b"utf-8", b"utf8"):
+        return False
+    try:
+        content.decode("utf-8")
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+class LxmlExtractor:
+    name = "lxml"
+
+    def __init__(self):
+        self._local    = threading.local()
+        self.xp_title  = etree.XPath(f"(//h1[{_cls('page-title')}]//span[{_cls('base')}])[1]")
+        self.xp_price  = etree.XPath(f"(//span[{_cls('price')}])[1]")
+        self.xp_stock  = etree.XPath(f"(//div[{_cls('stock')}])[1]")
+        self.xp_rows   = etree.XPath(f"//div[{_cls('product-info-main')}]//table[{_cls('data')}]//tr")
+        self.xp_th     = etree.XPath("(.//th)[1]")
+        self.xp_td     = etree.XPath("(.//td)[1]")
+        self.xp_links  = etree.XPath(f"//a[{_cls('product-item-link')}]/@href")
+        self.xp_items  = etree.XPath(f"//a[{_cls('product-item-link')}][@href]")
+        self.xp_item   = etree.XPath(f"ancestor::*[{_cls('product-item')}][1]")
+        self.xp_i_pr   = etree.XPath(f"(.//span[{_cls('price')}])[1]")
+        self.xp_i_st   = etree.XPath(f"(.//*[{_cls('stock')}])[1]")
+        self.xp_hrefs  = etree.XPath("//a/@href")
+        self.xp_thumbs = etree.XPath(f"//*[{_cls('product-thumb')}]")
+        self.xp_t_a    = etree.XPath("(.//a[@href])[1]")
+        self.xp_t_h4   = etree.XPath("(.//h4)[1]")
+        self.xp_t_pr   = etree.XPath(f"(.//*[{_cls('price')}])[1]")
+
+    def _parser(self):
+        # IPZS (Magento) e MTM (OpenCart) servono UTF-8: evita il fallback latin-1
+        # di libxml2 (le pagine non UTF-8 passano da _doc già decodificate). Un parser per thread, i parser lxml non vanno condivisi.
+        parser = getattr(self._local, "parser", None)
+        if parser is None:
+            parser = self._local.parser = lxml_html.HTMLParser(encoding="utf-8")
+        return parser
+
+    def _doc(self, content):
+        if not content or not content.strip():
+            return None
+        if isinstance(content, bytes) and not _is_utf8(content):
+            # charset dichiarato diverso da UTF-8 o byte non validi: stessa
+            # rilevazione di BeautifulSoup, poi parsing della stringa decodificata
+            content = UnicodeDammit(content, is_html=True).unicode_markup
+        try:
+            if isinstance(content, str):
+                return lxml_html.fromstring(content)
+            return lxml_html.fromstring(content, parser=self._parser())
+        except (etree.ParserError, ValueError):
+            return None
+
+    @staticmethod
+    def _first(xp, node):
+        found = xp(node)
+        return found[0] if found else None
+
+    def product(self, url, content):
+        doc = self._doc(content)
+        if doc is None:
+            return None
+        title = self._first(self.xp_title, doc)
+        pr    = self._first(self.xp_price, doc)
+        stock = self._first(self.xp_stock, doc)
+        attrs = {}
+        for tr in self.xp_rows(doc):
+            th, td = self._first(self.xp_th, tr), self._first(self.xp_td, tr)
+            if th is not None and td is not None:
+                attrs[_text(th).lower()] = _text(td)
+        return _build_product(
+            url,
+            _text(title) if title is not None else None,
+            _text(pr) if pr is not None else None,
+            _text(stock) if stock is not None else None,
+            attrs,
+        )
+
+    def product_links(self, content):
+        doc = self._doc(content)
+        return [h for h in self.xp_links(doc) if h] if doc is not None else []
+
+    def listing(self, content):
+        doc = self._doc(content)
+        if doc is None:
+            return []
+        out = []
+        for a in self.xp_items(doc):
+            if not a.get("href"):
+                continue
+            item  = self._first(self.xp_item, a)
+            price = self._first(self.xp_i_pr, item) if item is not None else None
+            stock = self._first(self.xp_i_st, item) if item is not None else None
+            out.append((
+                a.get("href"),
+                _text(price) if price is not None else "",
+                _text(stock).upper() if stock is not None else "",
+            ))
+        return out
+
+    def page(self, content):
+        doc = self._doc(content)
+        if doc is None:
+            return False, []
+        return self._first(self.xp_title, doc) is not None, [str(h) for h in self.xp_hrefs(doc)]
+
+    def mtm_thumbs(self, content):
+        doc = self._doc(content)
+        if doc is None:
+            return []
+        out = []
+        for block in self.xp_thumbs(doc):
+            a_tag     = self._first(self.xp_t_a, block)
+            title_tag = self._first(self.xp_t_h4, block)
+            price_tag = self._first(self.xp_t_pr, block)
+            if a_tag is None or title_tag is None:
+                continue
+            out.append((
+                a_tag.get("href"),
+                _text(title_tag),
+                _text(price_tag) if price_tag is not None else None,
+            ))
+        return out
+
+
+# ──────────────── Selezione backend
+BACKENDS = {"soup": SoupExtractor}
+if lxml_html is not None:
+    BACKENDS["lxml"] = LxmlExtractor
+
+
+def get_backend(name=None):
+    name = name or ("lxml" if "lxml" in BACKENDS else "soup")
+    if name not in BACKENDS:
+        print(f"⚠️ Extractor {name!r} non disponibile, uso 'soup'")
+        name = "soup"
+    return BACKENDS[name]()
+
+
+backend = get_backend(os.getenv("IPZS_EXTRACTOR"))
+
+
+def product(url, content):
+    return backend.product(url, content)
+
+
+def product_links(content):
+    return backend.product_links(content)
+
+
+def listing(content):
+    """Voci del listing categoria: (link, prezzo, badge stock) in ordine di pagina."""
+    return backend.listing(content)
+
+
+def page(content):
+    return backend.page(content)
+
+
+def mtm_thumbs(content):
+    return backend.mtm_thumbs(content)
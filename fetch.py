@@ -0,0 +1,281 @@
+import os
+import time
+import asyncio
+import weakref
+import threading
+from collections import deque
+from functools import partial
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import metrics
+
+# ──────────────── Config motore HTTP
+HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/136.0.0.0 Safari/537.36"
+    )
+}
+
+TIMEOUT        = (3, 6)
+PER_HOST_LIMIT = 6    # richieste contemporanee per dominio (valore di partenza)
+POOL_SIZE      = 24   # connessioni keep-alive e thread I/O totali
+
+# ──────────────── Concorrenza adattiva per host (AIMD)
+MIN_LIMIT       = 1
+MAX_LIMIT       = int(os.getenv("FETCH_MAX_PER_HOST", "16"))
+DECREASE        = 0.5    # taglio moltiplicativo su 429/5xx/Queue-it/blocco
+SLOW_FACTOR     = 3.0    # latenza oltre N× la media mobile: niente aumento
+CUT_COOLDOWN    = 2.0    # s: una raffica di errori dello stesso giro taglia una volta sola
+BACKOFF         = 1.0    # s di pausa dopo un taglio, raddoppia a ogni taglio consecutivo
+MAX_BACKOFF     = 30.0
+OVERLOAD_STATUS = frozenset({429, 500, 502, 503, 504})
+
+
+def build_session(pool_size=POOL_SIZE):
+    session = requests.Session()
+    retry = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+    )
+    adapter = HTTPAdapter(
+        max_retries=retry,
+        pool_connections=8,
+        pool_maxsize=pool_size,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    # richieste per host/status e byte scaricati (metrics.py)
+    session.hooks["response"].append(metrics.on_response)
+    return session
+
+
+def _retry_after(r):
+    try:
+        return min(MAX_BACKOFF, float(r.headers.get("Retry-After", "")))
+    except ValueError:
+        return None   # assente o in formato data
+
+
+def _overload_reason(r):
+    """Motivo di sovraccarico della risposta (anche nei tentativi di urllib3.Retry), o None."""
+    history = getattr(getattr(r.raw, "retries", None), "history", ()) or ()
+    statuses = {h.status for h in history if h.status} | {r.status_code}
+    if 429 in statuses:
+        return "429"
+    if statuses & OVERLOAD_STATUS:
+        return "5xx"
+    if "queue-it" in r.url.lower():
+        return "queueit"
+    return None
+
+
+class HostLimit:
+    """
+    Limite di concorrenza AIMD di un host, condiviso da tutti i loop del
+    processo: circa +1 richiesta per ogni giro di risposte sane e veloci,
+    dimezzato su 429/5xx, Queue-it o pagine di blocco, con una pausa
+    crescente (o Retry-After) prima delle richieste successive. Anche il
+    conteggio delle richieste in volo è unico per host: i gate dei vari loop
+    lo leggono sotto lock e vengono risvegliati quando si libera posto.
+    """
+
+    def __init__(self, host, start=PER_HOST_LIMIT):
+        self.host         = host
+        self.value        = float(start)
+        self.lock         = threading.Lock()
+        self.latency      = None    # media mobile delle risposte sane (s)
+        self.last_cut     = 0.0
+        self.cuts         = 0       # tagli consecutivi, azzerati dalla prima risposta sana
+        self.paused_until = 0.0
+        self.active       = 0       # richieste in volo, su tutti i loop
+        self.gates        = weakref.WeakSet()
+        metrics.set_limit(host, self.current, "start")
+
+    @property
+    def current(self):
+        return int(self.value)
+
+    def pause(self):
+        return max(0.0, self.paused_until - time.monotonic())
+
+    def acquire(self, gate):
+        """Occupa un posto; se è pieno accoda un Future sul gate (stesso lock: nessun risveglio perso)."""
+        with self.lock:
+            if self.active < self.current:
+                self.active += 1
+                return None
+            waiter = gate.loop.create_future()
+            gate.waiters.append(waiter)
+            return waiter
+
+    def release(self):
+        with self.lock:
+            self.active -= 1
+        self._wake()
+
+    def _wake(self):
+        # ogni gate sveglia i suoi waiter nel thread del proprio loop; loro ricontrollano il posto
+        for gate in list(self.gates):
+            loop = gate.loop
+            if loop is None or loop.is_closed():
+                self.gates.discard(gate)
+                continue
+            try:
+                loop.call_soon_threadsafe(gate.wake)
+            except RuntimeError:
+                self.gates.discard(gate)   # loop chiuso nel frattempo
+
+    def success(self, elapsed):
+        with self.lock:
+            slow = self.latency is not None and elapsed > SLOW_FACTOR * self.latency
+            self.latency = elapsed if self.latency is None else 0.9 * self.latency + 0.1 * elapsed
+            if slow:
+                return
+            self.cuts = 0
+            before = self.current
+            self.value = min(MAX_LIMIT, self.value + 1 / self.value)
+            limit = self.current
+        if limit != before:
+            metrics.set_limit(self.host, limit, "increase")
+            self._wake()
+
+    def overload(self, reason, retry_after=None):
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_cut < CUT_COOLDOWN:
+                return
+            self.last_cut = now
+            self.cuts += 1
+            self.value = max(MIN_LIMIT, self.value * DECREASE)
+            pause = retry_after or min(MAX_BACKOFF, BACKOFF * 2 ** (self.cuts - 1))
+            self.paused_until = now + pause
+            limit = self.current
+        metrics.set_limit(self.host, limit, reason)
+        print(f"🐢 {self.host}: {reason}, concorrenza → {limit} (pausa {pause:.0f}s)")
+
+
+class _Gate:
+    """Attesa di un loop asyncio sul conteggio in volo condiviso del HostLimit."""
+
+    def __init__(self, limit):
+        self.limit   = limit
+        # riferimento debole: il gate non tiene in vita il loop di un engine.run() finito
+        self._loop   = weakref.ref(asyncio.get_running_loop())
+        self.waiters = deque()
+        limit.gates.add(self)
+
+    @property
+    def loop(self):
+        return self._loop()
+
+    def wake(self):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def __aenter__(self):
+        while (waiter := self.limit.acquire(self)) is not None:
+            await waiter
+        # dopo un taglio: niente richieste finché dura la pausa
+        try:
+            while (pause := self.limit.pause()) > 0:
+                await asyncio.sleep(pause)
+        except BaseException:
+            self.limit.release()
+            raise
+
+    async def __aexit__(self, *exc):
+        self.limit.release()
+
+
+class FetchEngine:
+    """
+    Motore di fetch asyncio condiviso da scraping categorie, prodotti e spider.
+    Una sola requests.Session con pool keep-alive; le chiamate bloccanti girano
+    su un executor dedicato e un limite AIMD per host (HostLimit) regola la
+    concorrenza in base a latenza, status e pagine di blocco.
+    """
+
+    def __init__(self, per_host=PER_HOST_LIMIT, pool_size=POOL_SIZE, headers=None, session=None):
+        self.per_host = per_host
+        self.headers  = headers or HEADERS
+        self.session  = session or build_session(pool_size)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="fetch")
+        self.limits   = {}          # host → HostLimit, condiviso tra i loop
+        self.lock     = threading.Lock()
+        # le primitive asyncio sono legate al loop: un gate per (loop, host)
+        self._gates   = weakref.WeakKeyDictionary()
+
+    def limit(self, host):
+        with self.lock:
+            return self._limit_locked(host)
+
+    def _limit_locked(self, host):
+        if host not in self.limits:
+            self.limits[host] = HostLimit(host, self.per_host)
+        return self.limits[host]
+
+    def _gate(self, host):
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            gates = self._gates.setdefault(loop, {})
+            if host not in gates:
+                gates[host] = _Gate(self._limit_locked(host))
+            return gates[host]
+
+    def _prune(self):
+        # gate dei loop chiusi: non aspetterà più nessuno
+        with self.lock:
+            for loop in [l for l in self._gates if l.is_closed()]:
+                for gate in self._gates.pop(loop).values():
+                    gate.limit.gates.discard(gate)
+
+    def blocked(self, url):
+        """Pagina di blocco (captcha, access denied, challenge) riconosciuta da chi la parsa."""
+        self.limit(urlsplit(url).netloc).overload("blocked")
+
+    async def to_thread(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(fn, *args, **kwargs))
+
+    async def get(self, url, headers=None, timeout=TIMEOUT, **kwargs):
+        host = urlsplit(url).netloc
+        limit = self.limit(host)
+        async with self._gate(host):
+            t0 = time.perf_counter()
+            try:
+                r = await self.to_thread(
+                    self.session.get,
+                    url,
+                    headers=headers or self.headers,
+                    timeout=timeout,
+                    **kwargs,
+                )
+            except requests.exceptions.RequestException:
+                # timeout, connessione rifiutata, retry esauriti
+                limit.overload("error")
+                raise
+            reason = _overload_reason(r)
+            if reason:
+                limit.overload(reason, _retry_after(r))
+            else:
+                limit.success(time.perf_counter() - t0)
+            return r
+
+    def run(self, coro):
+        try:
+            return asyncio.run(coro)
+        finally:
+            self._prune()
+
+
+engine = FetchEngine()
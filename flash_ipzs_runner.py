@@ -1,32 +1,25 @@
-from main import (
-    get_links,
-    scrape_ipzs,
+from ipzs import (
+    sweep_ipzs,
     CATEGORY_URLS,
     flash_ipzs_cart
 )
-
-import time
+from fetch import engine
+from http_cache import cache
+import catalog
 
 
 def main():
     print("🚀 Avvio workflow separato Flash IPZS")
 
-    links = set()
-
-    for url in CATEGORY_URLS:
-        links.update(get_links(url))
-
-    print(f"🔎 Trovati {len(links)} link prodotto")
-
-    products = []
-
-    for link in links:
-        p = scrape_ipzs(link)
-        if p:
-            products.append(p)
-        time.sleep(0.2)
+    # snapshot condiviso con main e sniper; sweep concorrente solo se è vecchio
+    snap = catalog.current(
+        lambda: engine.run(sweep_ipzs(CATEGORY_URLS, with_sitemap=False)),
+        "flash_runner",
+    )
+    products = snap.products if snap else []
 
     print(f"📦 Prodotti validi trovati: {len(products)}")
+    cache.save()
 
     flash_ipzs_cart(products)
 
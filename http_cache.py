@@ -0,0 +1,122 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from datetime import datetime
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from utils import file_lock
+from metrics import metrics
+
+# ──────────────── Cache HTTP persistente (GET condizionali)
+CACHE_FILE = "http_cache.json"
+
+# form_key Magento cambia tra sessioni: non deve invalidare l'hash del body
+FORM_KEY_RE = re.compile(rb'(form_key["\'\s:=]+(?:value=)?["\']?)[A-Za-z0-9]{8,32}')
+
+
+def canonical_url(url):
+    parts = urlsplit(url.strip())
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    path  = parts.path or "/"
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, query, ""))
+
+
+def body_hash(content):
+    return hashlib.sha1(FORM_KEY_RE.sub(rb"\1", content)).hexdigest()
+
+
+class HttpCache:
+    """
+    Cache su disco indicizzata per URL canonico: conserva ETag/Last-Modified,
+    l'hash del body e il risultato già parsato per ciascun tipo di pagina
+    ("product", "links", ...), così un 304 o un body identico non richiedono
+    un nuovo parsing. Condivisa dai job del daemon e dai thread delle uscite:
+    scritture e serializzazione passano da un solo lock.
+    """
+
+    def __init__(self, path=CACHE_FILE):
+        self.path    = path
+        self.entries = {}
+        self.dirty   = False
+        self.lock    = threading.RLock()
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (json.JSONDecodeError, OSError):
+                print(f"⚠️ Cache {path} illeggibile, riparto da vuota.")
+
+    def validators(self, url):
+        e = self.entries.get(canonical_url(url))
+        if not e:
+            return {}
+        h = {}
+        if e.get("etag"):
+            h["If-None-Match"] = e["etag"]
+        if e.get("last_modified"):
+            h["If-Modified-Since"] = e["last_modified"]
+        return h
+
+    def lookup(self, url, kind, r):
+        """
+        Ritorna (True, parsed) se la risposta r conferma il contenuto in cache
+        (304 oppure stesso hash del body), altrimenti (False, None).
+        """
+        e = self.entries.get(canonical_url(url))
+        if not e or kind not in e.get("parsed", {}):
+            return False, None
+        if r.status_code == 304 or (r.status_code == 200 and body_hash(r.content) == e.get("hash")):
+            with self.lock:
+                self._touch(e, r)
+            return True, e["parsed"][kind]
+        return False, None
+
+    def parsed(self, url, kind):
+        """Ultimo risultato parsato per (url, kind), senza richieste di rete."""
+        e = self.entries.get(canonical_url(url))
+        return (e or {}).get("parsed", {}).get(kind)
+
+    def store(self, url, kind, r, parsed):
+        key = canonical_url(url)
+        h = body_hash(r.content)
+        with self.lock:
+            e = self.entries.get(key)
+            if not e or e.get("hash") != h:
+                e = {"hash": h, "parsed": {}}
+                self.entries[key] = e
+            e["parsed"][kind] = parsed
+            self._touch(e, r)
+
+    def remember(self, url, r):
+        """Solo i validatori ETag/Last-Modified, per risposte lette in streaming."""
+        with self.lock:
+            e = self.entries.setdefault(canonical_url(url), {"hash": None, "parsed": {}})
+            self._touch(e, r)
+
+    def _touch(self, e, r):
+        # chiamato con self.lock acquisito
+        if r.headers.get("ETag"):
+            e["etag"] = r.headers["ETag"]
+        if r.headers.get("Last-Modified"):
+            e["last_modified"] = r.headers["Last-Modified"]
+        e["ts"] = datetime.now().isoformat(timespec="seconds")
+        self.dirty = True
+
+    @metrics.timed("state_save")
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            # serializzazione sotto lock: un altro thread non può cambiare entries a metà dump
+            text = json.dumps(self.entries, ensure_ascii=False)
+            self.dirty = False
+        tmp = self.path + ".tmp"
+        with file_lock:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, self.path)
+
+
+cache = HttpCache()
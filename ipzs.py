@@ -0,0 +1,380 @@
+from ipzs_flash import login_ipzs, add_to_cart_ipzs_nowait, http_session_from_driver
+from browser_pool import pool, ipzs_key
+from session_vault import vault
+
+import time, asyncio
+import extract
+from datetime import datetime, timedelta
+
+# ──────────────── Stato (SQLite WAL, esportato nei file storici: vedi state.py)
+from state import open_store
+
+# ──────────────── Soglie tirature IPZS
+IPZS_LOW_HIGH = 1500  # alert standard
+IPZS_FLASH    = 500   # flash-cart
+
+# ──────────────── IPZS Config
+CATEGORY_URLS = [
+    f"https://www.shop.ipzs.it/it/catalog/category/view/s/monete/id/3/?p={i}"
+    for i in range(1, 6)
+]
+
+# ──────────────── Motore HTTP condiviso (asyncio + pool keep-alive)
+from fetch import engine, HEADERS
+from http_cache import cache
+from spider import Spider
+import sitemap
+from rules import flash_rules, ACTION_CART
+from product import Product
+from metrics import metrics
+
+# ──────────────── Telegram helper
+from utils import send
+
+# ──────────────── IPZS scraping
+async def aget_listing(url):
+    try:
+        with metrics.phase("category_fetch"):
+            r = await engine.get(url, headers={**HEADERS, **cache.validators(url)})
+
+        hit, entries = cache.lookup(url, "listing", r)
+        if hit:
+            return [tuple(e) for e in entries]
+
+        # 404/5xx non sono pagine di blocco: niente engine.blocked (il taglio AIMD
+        # per 429/5xx lo fa già il motore di fetch), lo status è già nelle metriche
+        if r.status_code != 200:
+            print(f"⚠️ Status {r.status_code} su category page: {url}")
+            return []
+        if not extract.is_valid(r.content):
+            print(f"⚠️ HTML sospetto su category page: {url}")
+            metrics.reject("invalid_page")
+            engine.blocked(url)
+            return []
+
+        with metrics.phase("parse"):
+            entries = await engine.to_thread(extract.listing, r.content)
+        cache.store(url, "listing", r, entries)
+        return entries
+    except Exception as e:
+        print(f"Errore get_links: {e}")
+        return []
+
+async def aget_links(url):
+    return [link for link, _, _ in await aget_listing(url)]
+
+def get_links(url):
+    return engine.run(aget_links(url))
+
+async def ascrape_ipzs(url):
+    try:
+        with metrics.phase("product_fetch"):
+            r = await engine.get(url, headers={**HEADERS, **cache.validators(url)})
+
+        # 304 o body invariato → risultato già parsato, niente parsing HTML
+        hit, info = cache.lookup(url, "product", r)
+        if hit:
+            return Product.from_dict(info)
+
+        if r.status_code != 200:
+            return None
+        if not extract.is_valid(r.content):
+            print(f"⚠️ HTML sospetto su product page: {url}")
+            metrics.reject("invalid_page")
+            engine.blocked(url)
+            return None
+        with metrics.phase("parse"):
+            info = await engine.to_thread(extract.product, url, r.content)
+        if not info:
+            return None
+        cache.store(url, "product", r, info)
+        return Product.from_dict(info)
+    except Exception as e:
+        print(f"Errore scrape_ipzs: {e}")
+        return None
+
+def scrape_ipzs(url):
+    return engine.run(ascrape_ipzs(url))
+
+# ──────────────── Fingerprint listing categorie
+REVISIT_TTL = timedelta(hours=6)   # riscarico comunque un prodotto dopo questo tempo
+
+def listing_signature(price, stock):
+    return f"{price}|{stock}"
+
+def needs_scrape(listing, link, signature, now):
+    row = listing.get(link)
+    if not row or row.get("signature") != signature:
+        return True
+    try:
+        scraped = datetime.fromisoformat(row["scraped_at"])
+    except (KeyError, ValueError):
+        return True
+    return now - scraped > REVISIT_TTL
+
+async def sweep_ipzs(category_urls, with_spider=False, fingerprint=True, with_sitemap=True,
+                     scrape_product=ascrape_ipzs):
+    """
+    Sweep completo IPZS in un solo giro di richieste sovrapposte:
+    ogni prodotto parte appena la sua categoria (o sitemap/spider) lo trova.
+    Con `fingerprint` i prodotti la cui voce di listing (prezzo, badge stock)
+    non è cambiata e con TTL valido riusano l'ultimo scrape in cache.
+    `scrape_product` è lo scrape di una pagina (IpzsShop.scrape in shops.py).
+    """
+    listing = open_store().listing
+    now     = datetime.now()
+    links, tasks, reused = set(), [], []
+
+    async def scrape(link, signature):
+        p = await scrape_product(link)
+        if p and signature is not None:
+            listing[link] = {"signature": signature, "scraped_at": now.isoformat()}
+        return p
+
+    def schedule(found):
+        for link, signature in found:
+            if link in links:
+                continue
+            links.add(link)
+            if fingerprint and signature is not None and not needs_scrape(listing, link, signature, now):
+                p = cache.parsed(link, "product")
+                if p:
+                    reused.append(Product.from_dict(p))
+                    continue
+            tasks.append(asyncio.create_task(scrape(link, signature)))
+
+    async def category(url):
+        entries = await aget_listing(url)
+        schedule((link, listing_signature(price, stock)) for link, price, stock in entries)
+
+    async def discover():
+        # sitemap: un documento (spesso 304) al posto del crawl per trovare le pagine nuove
+        schedule((link, None) for link in await sitemap.discover())
+
+    async def crawl():
+        # ogni prodotto trovato dallo spider parte subito, senza attendere la fine del crawl
+        await aspider(category_urls, on_product=lambda link: schedule([(link, None)]))
+
+    jobs = [category(u) for u in category_urls]
+    if with_sitemap:
+        jobs.append(discover())
+    if with_spider:
+        jobs.append(crawl())
+    await asyncio.gather(*jobs)
+
+    results = await asyncio.gather(*tasks)
+    print(f"🧮 Sweep IPZS: {len(tasks)} prodotti scaricati, {len(reused)} invariati dal listing")
+    return reused + [p for p in results if p]
+
+
+@metrics.timed("rules")
+def match_flash_rules(products):
+    """
+    Regola flash-cart (rules.Rule) che scatta per ciascun prodotto, o None.
+    Colonne dai valori già parsati dei Product; le regole stanno in flash_rules.json.
+    """
+    return flash_rules.evaluate(
+        [p.tiratura for p in products],
+        [p.price for p in products],
+        [p.text for p in products],
+    )
+
+
+def should_flash_cart(product):
+    rule = match_flash_rules([product])[0]
+    if rule is None:
+        return False, None
+    return True, rule.name
+
+def is_valid_ipzs_page(html):
+    # segnali di blocco / marcatori IPZS: vedi extract.BAD_SIGNALS e GOOD_SIGNALS
+    return extract.is_valid(html)
+
+# ──────────────── Notifiche standard
+def notify_new(prods, seen):
+    for p in prods:
+        if p.link in seen:
+            continue
+
+        if not p.available:
+            continue
+
+        # accodato nell'outbox: una raffica di uscite diventa un solo digest
+        if send(
+            f"{p.nome}\n"
+            f"{p.prezzo}\n"
+            f"{p.link}",
+            header="<b>Nuova moneta</b>",
+        ):
+            seen.add(p.link)
+
+    return seen
+
+def notify_low(prods, alerted):
+    for p in prods:
+        t = p.tiratura
+        if t and t <= IPZS_LOW_HIGH and p.available and p.link not in alerted:
+            msg = (
+                f"- NOME MONETA: {p.nome}\n"
+                f"- PREZZO: {p.prezzo}\n"
+                f"- CONTINGENTE: {p.contingente}\n"
+                f"- DISPONIBILITA: {p.disponibilita}\n"
+                f"- LINK: {p.link}"
+            )
+            if send(msg, header="<b>Moneta a bassa tiratura</b>"):
+                alerted.add(p.link)
+    return alerted
+
+def notify_dates(prods, alerts):
+    bucket = {}
+    for p in prods:
+        d = p.release
+        if d:
+            bucket.setdefault(d.date(), []).append(p)
+    now = datetime.now()
+    tomorrow = (now + timedelta(days=1)).date()
+
+    if tomorrow in bucket and len(bucket[tomorrow])>=3 and now.hour>=8:
+        key = str(tomorrow)
+        if alerts.get(key) != str(now.date()):
+            msg = f"<b>{len(bucket[tomorrow])} monete disponibili il {tomorrow}</b>\n"
+            msg += "\n".join(f"- {x.nome}" for x in bucket[tomorrow])
+            if send(msg):
+                alerts[key] = str(now.date())
+    return alerts
+
+# ──────────────── Spider semplice
+SPIDER_HOURS=(7,19)
+def spider_allowed():
+    n = datetime.now()
+    if n.hour not in SPIDER_HOURS: return False
+    meta = open_store().meta
+    last = meta.get("spider_ts")
+    if last and (n - datetime.fromisoformat(last)).total_seconds() < 3600: return False
+    meta["spider_ts"] = n.isoformat()
+    return True
+
+async def aspider(start, on_product=None, **kw):
+    # crawl concorrente a priorità del catalogo (vedi spider.py)
+    return await Spider(on_product=on_product, **kw).crawl(start)
+
+def spider(start, **kw):
+    return engine.run(aspider(start, **kw))
+
+# ──────────────── Flash-cart IPZS - Checkout carrello
+
+def flash_ipzs_cart(products):
+    # 1️⃣ Filtra prodotti da aggiungere automaticamente al carrello
+    # Regole e azione (cart / solo alert) in flash_rules.json, valutate sul batch intero.
+    available = [p for p in products if p.available]
+    to_flash = []
+    for p, rule in zip(available, match_flash_rules(available)):
+        # Nessuna regola matchata
+        if rule is None:
+            continue
+        # Solo le regole con action "cart" fanno add-to-cart automatico
+        if rule.action != ACTION_CART:
+            print(f"ℹ️ Solo alert Telegram ({rule.name}) → {p.nome}")
+            continue
+
+        p.flash_rule = rule.name
+        to_flash.append(p)
+        print(f"🔥 Flash-cart abilitato ({rule.name}) → {p.nome}")
+
+    print(f"📐 Hit regole flash-cart: {flash_rules.stats()}")
+    print(f"🔍 flash_ipzs_cart → prodotti candidati (≤{IPZS_FLASH}): {[p.link for p in to_flash]}")
+
+    if not to_flash:
+        print("ℹ️ flash_ipzs_cart → nessun prodotto da flash-carto, esco.")
+        return
+
+    # 2️⃣ Storico flash (tabella flash_log dello store, lookup per link)
+    flash_log = open_store().flash_log
+    print(f"🧾 flash_ipzs_cart → log flash: {len(flash_log)} link")
+
+    today = datetime.now().date()
+    added = []
+
+    # 3️⃣ Sessione IPZS valida dal vault (solo HTTP), altrimenti driver loggato dal pool
+    key = ipzs_key()
+    pooled = []   # driver del pool, preso solo se serve
+
+    def browser():
+        if not pooled:
+            pooled.append(pool.acquire(key, login_ipzs))
+        return pooled[0].driver if pooled[0] else None
+
+    http = vault.session(key)
+    if http is not None:
+        print("✅ flash_ipzs_cart → sessione IPZS dal vault, browser non avviato")
+    else:
+        driver = browser()
+        if driver is None:
+            print("❌ flash_ipzs_cart → login IPZS fallito, esco.")
+            return
+        http = http_session_from_driver(driver)
+        print("✅ flash_ipzs_cart → login IPZS riuscito")
+
+    pending = []
+    try:
+        # 4️⃣ Per ciascun prodotto, controlla se è già stato flashato nell’ultimo mese
+        for p in to_flash:
+            link = p.link
+            last = flash_log.get(link)
+            last_dt = None
+            if last:
+                try:
+                    last_dt = datetime.strptime(last, "%Y-%m-%d").date()
+                except:
+                    print(f"⚠️ flash_ipzs_cart → formato data invalido in log per {link}: {last}")
+            days = (today - last_dt).days if last_dt else None
+            print(f"   • {link} — ultimo flash: {last_dt} ({days} giorni fa)")
+
+            # decido se posso riflashare
+            if last_dt is None or (today - last_dt).days >= 30:
+                print(f"     → OK, provo add_to_cart")
+                # se il browser finisce in Queue-it resta parcheggiato e passo al prossimo
+                pending.append((p, add_to_cart_ipzs_nowait(browser, link, session=http)))
+            else:
+                print("     → saltato (flash già fatto meno di 30 giorni fa)")
+
+            time.sleep(0.3)
+
+        # 5️⃣ Raccolgo gli esiti (anche quelli ripresi dopo la coda) prima di rilasciare il driver
+        for p, fut in pending:
+            try:
+                success = fut.result()
+            except Exception as e:
+                print(f"❌ add_to_cart_ipzs errore su {p.link}: {e}")
+                success = False
+            print(f"       add_to_cart_ipzs {p.link} → {'OK' if success else 'Fallito'}")
+            if success:
+                added.append(p.nome)
+                flash_log[p.link] = today.isoformat()
+    finally:
+        # cookie rinnovati dal percorso HTTP (form_key, sessione) tornano nel vault
+        vault.from_session(key, http)
+        if pooled and pooled[0]:
+            pool.release(key, pooled[0], healthy=pooled[0].alive())
+
+    # 6️⃣ Log già aggiornato riga per riga: esporto il file leggibile
+    try:
+        open_store().export()
+        print(f"💾 flash_ipzs_cart → log salvato ({len(flash_log)} link)")
+    except Exception as e:
+        print(f"❌ flash_ipzs_cart → errore salvataggio log: {e}")
+
+    # 7️⃣ Notifica Telegram
+    if added:
+        cart_url = "https://www.shop.ipzs.it/it/checkout/"
+        msg = "<b>Flash-cart IPZS!</b>\nMonete aggiunte al carrello secondo regole:\n"
+        msg += "\n".join(
+            f"- {p.nome} ({p.flash_rule})"
+            for p in to_flash
+            if p.nome in added
+        )
+        msg += f"\n\n➡️ <a href=\"{cart_url}\">Vai al checkout IPZS</a>"
+        print(f"✉️ flash_ipzs_cart → invio notifica Telegram per: {added}")
+        send(msg)
+    else:
+        print("ℹ️ flash_ipzs_cart → nessuna aggiunta, nessuna notifica inviata")
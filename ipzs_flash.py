@@ -1,18 +1,43 @@
 import os
 import time
 import random
+from urllib.parse import urlsplit
+import requests
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
+import extract
+from fetch import HEADERS
+from queueit import park, in_queue, completed, QUEUED
+from session_vault import vault
+from browser_pool import ipzs_key
+from metrics import metrics
+
 # ─────────── Funzione random anti bot-detection ───────────
 def human_delay(a=0.4, b=1.3):
     time.sleep(random.uniform(a, b))
 
 # ─────────── Login IPZS ───────────
+ACCOUNT_URL = "https://www.shop.ipzs.it/it/customer/account/"
+
+
+def logged_in(driver):
+    driver.get(ACCOUNT_URL)
+    url = driver.current_url.lower()
+    return "customer/account" in url and "login" not in url
+
+
 def login_ipzs(driver):
     from selenium.webdriver.support.ui import WebDriverWait
     from selenium.webdriver.support import expected_conditions as EC
+
+    # ─────────── Sessione dal vault: niente form se è ancora valida ───────────
+    key = ipzs_key()
+    if vault.alive(key) and vault.to_driver(key, driver) and logged_in(driver):
+        print("✅ Sessione IPZS ripristinata dal vault")
+        return True
+
     login_url = "https://www.shop.ipzs.it/it/customer/account/login/"
     driver.get(login_url)
     WebDriverWait(driver, 20).until(
@@ -21,22 +46,13 @@ def login_ipzs(driver):
     print(f"🌐 URL iniziale: {driver.current_url}")
 
     # ─────────── Gestione Queue-it ───────────
-    if "queue-it" in driver.current_url.lower():
-        print("⏳ Queue-it rilevato: attendo uscita dalla coda...")
-
-        try:
-            WebDriverWait(driver, 300).until(
-                lambda d: "queue-it" not in d.current_url.lower()
-            )
-            print(f"✅ Uscito dalla coda. Nuovo URL: {driver.current_url}")
-
-            driver.get(login_url)
-            time.sleep(2)
-            print(f"🔁 Riapro login page: {driver.current_url}")
-
-        except Exception as e:
-            print(f"❌ Timeout attesa Queue-it: {e}")
+    # il login è un prerequisito: qui si aspetta davvero, ma l'attesa viene registrata
+    if in_queue(driver):
+        if not park.wait(driver, "login IPZS"):
             return False
+        driver.get(login_url)
+        time.sleep(2)
+        print(f"🔁 Riapro login page: {driver.current_url}")
 
     # ─────────── Attesa login page reale ───────────
     try:
@@ -90,19 +106,8 @@ def login_ipzs(driver):
     # ─────────── Attesa redirect post-login ───────────
     time.sleep(3)
 
-    if "queue-it" in driver.current_url.lower():
-        print("⏳ Queue-it rilevato dopo il login...")
-
-        try:
-            WebDriverWait(driver, 300).until(
-                lambda d: "queue-it" not in d.current_url.lower()
-            )
-
-            print(f"✅ Uscito dalla Queue-it post-login: {driver.current_url}")
-
-        except Exception as e:
-            print(f"❌ Timeout Queue-it post-login: {e}")
-            return False
+    if in_queue(driver) and not park.wait(driver, "post-login IPZS"):
+        return False
 
     # ─────────── Verifica login riuscito ───────────
     try:
@@ -113,6 +118,7 @@ def login_ipzs(driver):
         )
 
         print("✅ Login IPZS riuscito.")
+        vault.from_driver(key, driver)
         return True
 
     except Exception as e:
@@ -127,25 +133,128 @@ def login_ipzs(driver):
         return False
        
 
-# ─────────── Aggiungi al carrello IPZS ───────────
-def add_to_cart_ipzs(driver, product_url):
-    driver.get(product_url)
+# ─────────── Carrello IPZS via HTTP (Magento) ───────────
+SECTIONS_URL = (
+    "https://www.shop.ipzs.it/it/customer/section/load/"
+    "?sections=cart&force_new_section_timestamp=true"
+)
+AJAX_HEADERS = {
+    **HEADERS,
+    "X-Requested-With": "XMLHttpRequest",
+    "Accept": "application/json, text/javascript, */*; q=0.01",
+}
 
-    # ─────────── Gestione Queue-it sulla pagina prodotto ───────────
-    if "queue-it" in driver.current_url.lower():
-        print("⏳ Queue-it rilevato sulla pagina prodotto...")
+# esiti del percorso HTTP
+CART_ADDED     = "ADDED"
+CART_NOT_AVAIL = "NOT_AVAILABLE"
+CART_FAILED    = "FAILED"
+CART_FALLBACK  = "FALLBACK"   # Queue-it / challenge / form non riconosciuto → Selenium
 
-        try:
-            WebDriverWait(driver, 300).until(
-                lambda d: "queue-it" not in d.current_url.lower()
-            )
 
-            driver.get(product_url)
-            print(f"🔁 Riapro pagina prodotto: {driver.current_url}")
+def http_session_from_driver(driver):
+    """Sessione requests con i cookie del browser loggato (passando dal vault)."""
+    vault.from_driver(ipzs_key(), driver)
+    return vault.to_session(ipzs_key())
 
-        except Exception as e:
-            print(f"❌ Timeout Queue-it prodotto: {e}")
-            return False
+
+def _blocked(r):
+    if "queue-it" in r.url.lower():
+        return True
+    if not extract.is_valid(r.content):
+        metrics.reject("invalid_page")
+        return True
+    return False
+
+
+@metrics.timed("add_to_cart")
+def add_to_cart_ipzs_http(session, product_url):
+    """
+    Add-to-cart Magento in un round-trip: form_key e ID prodotto dalla pagina,
+    POST AJAX su checkout/cart/add e conferma dalla sezione customer-data "cart".
+    """
+    try:
+        r = session.get(product_url, headers=HEADERS, timeout=(3, 6))
+        if _blocked(r):
+            print(f"⏳ HTTP cart: Queue-it/challenge su {product_url} → fallback Selenium")
+            return CART_FALLBACK
+
+        info = extract.product(product_url, r.content)
+        if info and info["disponibilita"] == "NON DISPONIBILE":
+            return CART_NOT_AVAIL
+
+        form = extract.cart_form(r.content)
+        if not form:
+            print(f"⚠️ HTTP cart: form add-to-cart non trovato su {product_url}")
+            return CART_FALLBACK
+        action, form_key, product_id = form
+
+        # Magento confronta il form_key del POST con il cookie omonimo
+        if not session.cookies.get("form_key"):
+            session.cookies.set("form_key", form_key, domain=urlsplit(product_url).hostname, path="/")
+
+        r = session.post(
+            action,
+            data={"product": product_id, "form_key": form_key, "qty": "1"},
+            headers={**AJAX_HEADERS, "Referer": product_url},
+            timeout=(3, 10),
+        )
+        if "queue-it" in r.url.lower():
+            print("⏳ HTTP cart: Queue-it sul POST → fallback Selenium")
+            return CART_FALLBACK
+        if r.status_code != 200:
+            print(f"❌ HTTP cart: status {r.status_code} su {product_url}")
+            return CART_FAILED
+
+        r = session.get(SECTIONS_URL, headers={**AJAX_HEADERS, "Referer": product_url}, timeout=(3, 6))
+        sections = r.json()
+        items = sections.get("cart", {}).get("items", []) if isinstance(sections, dict) else []
+        if any(str(i.get("product_id")) == str(product_id) for i in items):
+            print(f"✅ add_to_cart_ipzs_http: prodotto {product_id} nel carrello")
+            return CART_ADDED
+
+        print(f"❌ add_to_cart_ipzs_http: prodotto {product_id} non presente nel carrello")
+        return CART_FAILED
+
+    except (requests.RequestException, ValueError) as e:
+        # rete o JSON della sezione cart illeggibile; i bug del codice non finiscono nel fallback
+        print(f"⚠️ HTTP cart errore su {product_url}: {e} → fallback Selenium")
+        return CART_FALLBACK
+
+
+# ─────────── Aggiungi al carrello IPZS ───────────
+def add_to_cart_ipzs_nowait(browser, product_url, session):
+    """
+    Percorso HTTP diretto; Selenium solo per Queue-it / challenge: `browser()`
+    fornisce il driver (o None) e viene chiamato solo in quel caso. Ritorna un
+    Future: se il browser finisce in coda resta parcheggiato e il chiamante
+    può intanto passare ai prodotti successivi.
+    """
+    outcome = add_to_cart_ipzs_http(session, product_url)
+    if outcome != CART_FALLBACK:
+        return completed(outcome == CART_ADDED)
+
+    driver = browser()
+    if driver is None:
+        print(f"❌ Nessun browser IPZS disponibile per {product_url}")
+        return completed(False)
+    return add_to_cart_ipzs_browser(driver, product_url)
+
+
+def add_to_cart_ipzs_browser(driver, product_url):
+    return park.submit(
+        driver, lambda d: _cart_browser(d, product_url),
+        label=f"cart {product_url.rsplit('/', 1)[-1]}", on_timeout=False,
+    )
+
+
+@metrics.timed("add_to_cart")
+def _cart_browser(driver, product_url):
+    driver.get(product_url)
+
+    # ─────────── Queue-it sulla pagina prodotto: si parcheggia, si riprende da capo ───────────
+    if in_queue(driver):
+        print("⏳ Queue-it rilevato sulla pagina prodotto...")
+        return QUEUED
 
     # ─────────── Attesa campo quantità ───────────
     try:
@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import functools
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.parse import urlsplit
+
+# ──────────────── Metriche per fase (textfile Prometheus + record JSONL)
+METRICS_DIR = os.getenv("METRICS_DIR", "metrics")
+RUNS_FILE   = "runs.jsonl"
+PREFIX      = "ipzs_bot"
+
+# limiti superiori (s) degli istogrammi di latenza
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+HISTORY_MAX = 1000   # variazioni del limite di concorrenza tenute per run
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count", "max")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum    = 0.0
+        self.count  = 0
+        self.max    = 0.0
+
+    def observe(self, value):
+        for i, le in enumerate(BUCKETS):
+            if value <= le:
+                self.counts[i] += 1
+                break
+        self.sum   += value
+        self.count += 1
+        self.max    = max(self.max, value)
+
+    def cumulative(self):
+        out, acc = [], 0
+        for n in self.counts:
+            acc += n
+            out.append(acc)
+        return out
+
+
+def _escape(v):
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**kw):
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in kw.items()) + "}"
+
+
+class Metrics:
+    """
+    Contatori in memoria del processo: latenza per fase (istogrammi), richieste
+    HTTP per host e status, byte scaricati, pagine scartate (Queue-it, HTML non
+    valido), limite di concorrenza per host e sue variazioni. `write(run)` li scrive come textfile Prometheus (uno per tipo di
+    run, sovrascritto) e aggiunge una riga a runs.jsonl.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.io   = threading.Lock()   # job del daemon che finiscono insieme
+        # limite attuale per host: stato del motore HTTP, sopravvive al reset
+        self.limits = {}
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started    = time.time()
+            self.phases     = {}
+            self.requests   = Counter()   # (host, status) → n
+            self.bytes      = Counter()   # host → byte
+            self.rejections = Counter()   # motivo → n
+            self.limit_changes = Counter()   # (host, motivo) → n
+            self.limit_history = []          # (s dall'avvio, host, limite, motivo)
+
+    # ─────────── Registrazione
+    def observe(self, phase, seconds):
+        with self.lock:
+            self.phases.setdefault(phase, Histogram()).observe(seconds)
+
+    @contextmanager
+    def phase(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0)
+
+    def timed(self, name):
+        """Decoratore: misura la funzione (sync o async) come fase `name`."""
+        def wrap(fn):
+            if asyncio.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def awrapper(*args, **kwargs):
+                    with self.phase(name):
+                        return await fn(*args, **kwargs)
+                return awrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.phase(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return wrap
+
+    def reject(self, reason):
+        with self.lock:
+            self.rejections[reason] += 1
+
+    def set_limit(self, host, value, reason):
+        """Nuovo limite di concorrenza AIMD di un host (fetch.HostLimit)."""
+        with self.lock:
+            self.limits[host] = value
+            self.limit_changes[(host, reason)] += 1
+            if len(self.limit_history) < HISTORY_MAX:
+                self.limit_history.append((round(time.time() - self.started, 3), host, value, reason))
+
+    def on_response(self, r, *args, **kwargs):
+        """Hook "response" di requests: conteggio per host/status e byte."""
+        host = urlsplit(r.url).netloc
+        if kwargs.get("stream"):
+            # body non ancora letto: ci si accontenta di Content-Length
+            size = int(r.headers.get("Content-Length") or 0)
+        else:
+            size = len(r.content)
+        with self.lock:
+            self.requests[(host, r.status_code)] += 1
+            self.bytes[host] += size
+            if "queue-it" in r.url.lower():
+                self.rejections["queueit"] += 1
+        return r
+
+    # ─────────── Export
+    def snapshot(self):
+        with self.lock:
+            return {
+                "phases": {
+                    name: {
+                        "count": h.count,
+                        "sum":   round(h.sum, 3),
+                        "max":   round(h.max, 3),
+                        "mean":  round(h.sum / h.count, 3) if h.count else 0,
+                    }
+                    for name, h in sorted(self.phases.items())
+                },
+                "requests": {
+                    f"{host} {status}": n for (host, status), n in sorted(self.requests.items())
+                },
+                "bytes":      dict(sorted(self.bytes.items())),
+                "rejections": dict(sorted(self.rejections.items())),
+                "concurrency": dict(sorted(self.limits.items())),
+                "concurrency_history": list(self.limit_history),
+            }
+
+    def render(self, run):
+        lines = []
+
+        def head(name, kind, help_):
+            lines.append(f"# HELP {PREFIX}_{name} {help_}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+
+        with self.lock:
+            head("phase_seconds", "histogram", "Durata delle fasi del run")
+            for name, h in sorted(self.phases.items()):
+                for le, n in zip(BUCKETS, h.cumulative()):
+                    lines.append(f"{PREFIX}_phase_seconds_bucket{_labels(run=run, phase=name, le=le)} {n}")
+                lines.append(f"{PREFIX}_phase_seconds_bucket{_labels(run=run, phase=name, le='+Inf')} {h.count}")
+                lines.append(f"{PREFIX}_phase_seconds_sum{_labels(run=run, phase=name)} {h.sum:.6f}")
+                lines.append(f"{PREFIX}_phase_seconds_count{_labels(run=run, phase=name)} {h.count}")
+
+            head("http_requests_total", "counter", "Richieste HTTP per host e status")
+            for (host, status), n in sorted(self.requests.items()):
+                lines.append(f"{PREFIX}_http_requests_total{_labels(run=run, host=host, status=status)} {n}")
+
+            head("http_bytes_total", "counter", "Byte scaricati per host")
+            for host, n in sorted(self.bytes.items()):
+                lines.append(f"{PREFIX}_http_bytes_total{_labels(run=run, host=host)} {n}")
+
+            head("rejections_total", "counter", "Pagine scartate (Queue-it, HTML non valido)")
+            for reason, n in sorted(self.rejections.items()):
+                lines.append(f"{PREFIX}_rejections_total{_labels(run=run, reason=reason)} {n}")
+
+            head("host_concurrency_limit", "gauge", "Limite AIMD di richieste contemporanee per host")
+            for host, n in sorted(self.limits.items()):
+                lines.append(f"{PREFIX}_host_concurrency_limit{_labels(run=run, host=host)} {n}")
+
+            head("concurrency_changes_total", "counter", "Variazioni del limite per host e motivo")
+            for (host, reason), n in sorted(self.limit_changes.items()):
+                lines.append(f"{PREFIX}_concurrency_changes_total{_labels(run=run, host=host, reason=reason)} {n}")
+
+            head("run_duration_seconds", "gauge", "Durata del run")
+            lines.append(f"{PREFIX}_run_duration_seconds{_labels(run=run)} {time.time() - self.started:.3f}")
+            head("run_timestamp_seconds", "gauge", "Fine del run (epoch)")
+            lines.append(f"{PREFIX}_run_timestamp_seconds{_labels(run=run)} {time.time():.0f}")
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, run, directory=None, **extra):
+        """Textfile Prometheus `<dir>/ipzs_bot_<run>.prom` + una riga in runs.jsonl."""
+        directory = directory or METRICS_DIR
+        record = {
+            "run":        run,
+            "started":    datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            "duration_s": round(time.time() - self.started, 3),
+            **extra,
+            **self.snapshot(),
+        }
+        prom = os.path.join(directory, f"{PREFIX}_{run}.prom")
+        with self.io:
+            try:
+                os.makedirs(directory, exist_ok=True)
+                tmp = prom + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(self.render(run))
+                # rename atomico: il node exporter non legge mai un file a metà
+                os.replace(tmp, prom)
+                with open(os.path.join(directory, RUNS_FILE), "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            except OSError as e:
+                print(f"⚠️ Metriche non salvate: {e}")
+                return
+
+        print(f"📊 Metriche {run}: " + ", ".join(
+            f"{name} {h['sum']:.1f}s" for name, h in record["phases"].items()
+        ))
+
+metrics = Metrics()
@@ -0,0 +1,240 @@
+from mtm_flash import login_mtm, add_to_cart_and_checkout
+from browser_pool import pool, mtm_key
+
+import os, time, asyncio
+import extract
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, urlunsplit, parse_qs, parse_qsl, urlencode
+from concurrent.futures import ThreadPoolExecutor
+
+# ──────────────── MTM Credentials
+MTM_ACCOUNTS = [
+    {"user": os.getenv("MTM_USERNAME"),        "pwd": os.getenv("MTM_PASSWORD")},
+    {"user": os.getenv("MTM_USERNAME_ALTERN"), "pwd": os.getenv("MTM_PASSWORD")},
+]
+
+# ──────────────── Stato (SQLite WAL, esportato nei file storici: vedi state.py)
+from state import open_store
+
+# ──────────────── Motore HTTP condiviso
+from fetch import engine
+from product import Product
+from metrics import metrics
+
+# ──────────────── MTM Monaco Config
+MTM_ROOT   = "https://www.mtm-monaco.mc/index.php?route=common/home"
+MTM_HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
+MTM_CATEGORIES_TTL = timedelta(hours=12)   # elenco categorie della homepage in cache
+MTM_PAGE_LIMIT     = 100                   # prodotti per pagina (parametro limit di OpenCart)
+MTM_BATCH          = 10                    # target al carrello per run, gli altri al giro dopo
+MTM_MAX_ATTEMPTS   = 3                     # carrelli falliti prima di rinunciare a un target
+# personalizzabile, inserire nell'elenco le parole chiave di interesse
+MTM_KEYWORDS = ["PROOF", "BE", "ORO", "ARGENTO", "2 EURO", "FS", "LIMITED"]
+
+def is_mtm_target(title):
+    t = title.upper()
+    return any(k in t for k in MTM_KEYWORDS)
+
+# ──────────────── Telegram helper
+from utils import send
+
+# ──────────────── Flash-cart MTM Monaco - Checkout carrello
+def mtm_categories(content):
+    # link di categoria della homepage MTM: se mancano è un blocco o una pagina d'errore
+    _, hrefs = extract.page(content)
+    return list(set(h for h in hrefs if "product/category" in h))
+
+async def amtm_category_links(meta):
+    """Categorie dalla homepage MTM, in cache nello store per MTM_CATEGORIES_TTL."""
+    now = datetime.now()
+    cached = meta.get("mtm_categories")
+    if cached and now - datetime.fromisoformat(meta["mtm_categories_ts"]) < MTM_CATEGORIES_TTL:
+        return cached.split()
+
+    cat_links = []
+    try:
+        response = await engine.get(MTM_ROOT, headers=MTM_HEADERS, timeout=(3, 20))
+        if response.status_code != 200:
+            print(f"⚠️ MTM status code anomalo: {response.status_code}")
+        else:
+            # 🛡️ Controllo HTML valido
+            cat_links = mtm_categories(response.content)
+    except Exception as e:
+        print(f"⚠️ Homepage MTM non raggiungibile: {e}")
+
+    if not cat_links:
+        if cached:
+            print("⚠️ MTM senza categorie (possibile blocco o errore): uso l'elenco in cache")
+            return cached.split()
+        print("❌ MTM non raggiungibile o nessuna categoria trovata")
+        return []
+
+    meta["mtm_categories"] = " ".join(sorted(cat_links))
+    meta["mtm_categories_ts"] = now.isoformat()
+    return cat_links
+
+def mtm_page_url(cat_url, page=1):
+    parts = urlsplit(cat_url)
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k not in ("page", "limit")]
+    query.append(("limit", str(MTM_PAGE_LIMIT)))
+    if page > 1:
+        query.append(("page", str(page)))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+def mtm_last_page(cat_url, hrefs):
+    # ultima pagina dai link di paginazione della stessa categoria (anche ">|")
+    path = parse_qs(urlsplit(cat_url).query).get("path")
+    pages = [1]
+    for h in hrefs:
+        q = parse_qs(urlsplit(h).query)
+        if q.get("path") == path and q.get("page", [""])[0].isdigit():
+            pages.append(int(q["page"][0]))
+    return max(pages)
+
+async def amtm_category(cat_url):
+    """Blocchi .product-thumb di tutte le pagine di una categoria: la prima, poi le altre in parallelo."""
+    async def fetch(page):
+        try:
+            response = await engine.get(mtm_page_url(cat_url, page), headers=MTM_HEADERS, timeout=(3, 10))
+            return response.content if response.status_code == 200 else None
+        except Exception as e:
+            print(f"Errore fetch_category: {e}")
+            return None
+
+    first = await fetch(1)
+    if first is None:
+        return []
+    blocks = await engine.to_thread(extract.mtm_thumbs, first)
+    _, hrefs = await engine.to_thread(extract.page, first)
+    last = mtm_last_page(cat_url, hrefs)
+
+    for content in await asyncio.gather(*(fetch(p) for p in range(2, last + 1))):
+        if content:
+            blocks += await engine.to_thread(extract.mtm_thumbs, content)
+    return blocks
+
+@metrics.timed("mtm_scan")
+async def ascan_mtm_monaco(seen):
+    """
+    Scan completo MTM: tutte le categorie e tutte le loro pagine in parallelo.
+    Ritorna tutti i target nuovi (MTM_KEYWORDS, non ancora visti) per un
+    unico checkout; `seen` si aggiorna solo dopo il carrello.
+    """
+    cat_links = await amtm_category_links(open_store().meta)
+    pages = await asyncio.gather(*(amtm_category(u) for u in cat_links))
+
+    new_products, skus = [], set()
+    for blocks in pages:
+        for link, title, price in blocks:
+            # 🎯 PRE-FILTRO (parole chiave in MTM_KEYWORDS)
+            if not is_mtm_target(title) or link in seen:
+                continue
+            p = Product(link, title, prezzo=price or "N/D", shop="mtm")
+            # stesso prodotto in più categorie
+            if p.sku in skus:
+                continue
+            skus.add(p.sku)
+            new_products.append(p)
+            print(f"⚡ TARGET: {title}")
+
+    total = sum(len(b) for b in pages)
+    print(f"🧮 Scan MTM: {len(cat_links)} categorie, {total} prodotti, {len(new_products)} target nuovi")
+    return new_products
+
+def mtm_checkout_worker(user, pwd, new_products):
+    """
+    Checkout completo di un account MTM nel suo driver isolato.
+    Ritorna (user, logged, [titoli aggiunti], [titoli falliti]).
+    """
+    print(f"🔐 Login MTM con account {user}")
+    login = lambda d: login_mtm(d, username=user, password=pwd)
+    added, failed = [], []
+
+    with pool.session(mtm_key(user), login) as driver:
+        if not driver:
+            return user, False, added, [p.nome for p in new_products]
+
+        for p in new_products:
+            print(f"🛒 [{user}] aggiungo: {p.nome}")
+            with metrics.phase("add_to_cart"):
+                ok = add_to_cart_and_checkout(driver, p.link)
+
+            (added if ok else failed).append(p.nome)
+
+            time.sleep(1)
+
+    return user, True, added, failed
+
+def handle_mtm_checkout(new_products, seen):
+    print(f"🆕 Nuovi prodotti trovati MTM: {len(new_products)}")
+    if len(new_products) > MTM_BATCH:
+        print(f"📦 Carrello MTM limitato a {MTM_BATCH} target, {len(new_products) - MTM_BATCH} al prossimo giro")
+        new_products = new_products[:MTM_BATCH]
+
+    accounts = [(a["user"], a["pwd"]) for a in MTM_ACCOUNTS if a["user"] and a["pwd"]]
+    results = {}
+
+    # un worker per account: il secondo carrello non aspetta il primo
+    if accounts:
+        with ThreadPoolExecutor(max_workers=len(accounts)) as executor:
+            futures = [
+                executor.submit(mtm_checkout_worker, user, pwd, new_products)
+                for user, pwd in accounts
+            ]
+            for future in futures:
+                try:
+                    user, logged, added, failed = future.result()
+                except Exception as e:
+                    print(f"❌ Worker checkout MTM fallito: {e}")
+                    continue
+                results[user] = (logged, added, failed)
+
+    if any(added for _, added, _ in results.values()):
+        cart_url = "https://www.mtm-monaco.mc/index.php?route=checkout/cart"
+
+        msg = "<b>Flash monete Monaco!</b>\n"
+        msg += "Sono state aggiunte:\n"
+        for user, _ in accounts:
+            if user not in results:
+                continue
+            logged, added, failed = results[user]
+            msg += f"\n👤 {user}\n"
+            if not logged:
+                msg += "❌ login fallito\n"
+            msg += "".join(f"- {t}\n" for t in added)
+            msg += "".join(f"- ⚠️ {t} (non aggiunta)\n" for t in failed if logged)
+        msg += f"\n➡️ <a href=\"{cart_url}\">Checkout</a>"
+
+        send(msg)
+    else:
+        print("ℹ️ Nessun prodotto interessante MTM")
+
+    # visti i prodotti finiti in almeno un carrello (o tutti, senza account da usare);
+    # gli altri si riprovano al prossimo giro, fino a MTM_MAX_ATTEMPTS carrelli falliti
+    meta = open_store().meta
+    carted = {t for _, added, _ in results.values() for t in added}
+    tried = any(logged for logged, _, _ in results.values())
+    given_up = []
+    for p in new_products:
+        key = f"mtm_attempts:{p.link}"
+        if p.nome in carted or not accounts:
+            seen.add(p.link)
+            meta.pop(key, None)
+        elif tried:
+            # login riuscito ma carrello fallito: esaurito o pagina cambiata
+            attempts = int(meta.get(key, 0)) + 1
+            if attempts >= MTM_MAX_ATTEMPTS:
+                seen.add(p.link)
+                meta.pop(key, None)
+                given_up.append(p)
+            else:
+                meta[key] = str(attempts)
+
+    if given_up:
+        print(f"🚫 MTM: rinuncio a {len(given_up)} target dopo {MTM_MAX_ATTEMPTS} carrelli falliti")
+        send(
+            f"⚠️ <b>MTM</b>: carrello fallito {MTM_MAX_ATTEMPTS} volte, non riprovo:\n"
+            + "".join(f"- <a href=\"{p.link}\">{p.nome}</a>\n" for p in given_up)
+        )
+
+    open_store().export()
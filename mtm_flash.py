@@ -2,6 +2,7 @@
 import os
 import time
 import random
+import socket
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
@@ -11,15 +12,22 @@ from selenium.webdriver.chrome.service import Service
 def human_delay(a=0.4, b=1.3):
     time.sleep(random.uniform(a, b))
 
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
 # ─────────────── Login e carrello MTM Monaco
-def setup_driver_headless():
+def setup_driver_headless(debug_port=None):
+    # porta di debug dinamica: più Chromium (pool, sniper, MTM) possono convivere
+    debug_port = debug_port or free_port()
     options = Options()
 
     options.add_argument("--headless=new")
     options.add_argument("--disable-gpu")
     options.add_argument("--no-sandbox")
     options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--remote-debugging-port=9222")
+    options.add_argument(f"--remote-debugging-port={debug_port}")
     options.add_argument("--window-size=1920,1080")
     options.add_argument("--disable-blink-features=AutomationControlled")
     options.add_experimental_option("excludeSwitches", ["enable-automation"])
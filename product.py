@@ -0,0 +1,175 @@
+import re
+from enum import Enum
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+
+# ──────────────── Parser campi prodotto
+FORMATS = ["%d %b %Y","%d %B %Y","%d/%m/%Y","%Y-%m-%d"]
+
+
+def parse_tiratura(txt):
+    nums = re.findall(r"\d+", txt.replace(".","").replace(" ",""))
+    return int(nums[0]) if nums else None
+
+
+def _price(txt):
+    txt = (
+        txt.replace("€", "")
+           .replace("EUR", "")
+           .replace(".", "")
+           .replace(",", ".")
+           .strip()
+    )
+    return float(txt)
+
+
+def parse_price(txt):
+    try:
+        return _price(txt)
+    except Exception as e:
+        print(f"Errore parse_price: {e}")
+        return None
+
+
+def parse_date(txt):
+    for f in FORMATS:
+        try:
+            return datetime.strptime(txt.strip(), f)
+        except:
+            pass
+    return None
+
+
+def normalize_text(txt):
+    return (txt or "").lower().strip()
+
+
+# ──────────────── Product
+class Availability(Enum):
+    AVAILABLE     = "DISPONIBILE"
+    NOT_AVAILABLE = "NON DISPONIBILE"
+    UNKNOWN       = "N/A"
+
+    @classmethod
+    def parse(cls, txt):
+        raw = (txt or "").upper()
+        if "NON DISPONIBILE" in raw:
+            return cls.NOT_AVAILABLE
+        if "DISPONIBILE" in raw:
+            return cls.AVAILABLE
+        return cls.UNKNOWN
+
+
+# codice articolo IPZS in coda allo slug, es. ...48-2ms10-25f0015.html
+IPZS_SKU_RE = re.compile(r"(\d[a-z]{2}\d{2}-\d{2}[a-z]\d{3,4})(?:\.html)?/?$", re.I)
+PRODUCT_ID_RE = re.compile(r"/product/view/id/(\d+)")
+
+# chiave storica (dict degli scrape e cache HTTP) → attributo
+FIELDS = {
+    "link":               "link",
+    "nome":               "nome",
+    "prezzo":             "prezzo",
+    "disponibilita":      "disponibilita",
+    "contingente":        "contingente",
+    "data disponibilita": "data_disponibilita",
+    "finitura":           "finitura",
+    "metallo":            "metallo",
+    "peso (gr)":          "peso",
+    "in vendita da":      "in_vendita_da",
+}
+
+
+def canonical_sku(link, shop="ipzs"):
+    if shop == "mtm":
+        pid = parse_qs(urlsplit(link).query).get("product_id")
+        return f"MTM-{pid[0]}" if pid else link
+    m = IPZS_SKU_RE.search(link)
+    if m:
+        return m.group(1).upper()
+    m = PRODUCT_ID_RE.search(link)
+    if m:
+        return f"ID-{m.group(1)}"
+    return urlsplit(link).path.rstrip("/").rsplit("/", 1)[-1].removesuffix(".html")
+
+
+class Product:
+    """
+    Prodotto di uno shop: campi testuali come scrapati più i valori parsati
+    una volta sola alla creazione (tiratura, prezzo, disponibilità, data
+    d'uscita, SKU). I campi che non si riescono a parsare finiscono in
+    `errors` (campo → testo originale) invece di sparire nel None.
+    Supporta ancora p["nome"] / p.get("contingente") per il codice esistente.
+    """
+
+    __slots__ = (
+        "shop", "link", "nome", "prezzo", "disponibilita", "contingente",
+        "data_disponibilita", "finitura", "metallo", "peso", "in_vendita_da",
+        "tiratura", "price", "availability", "release", "sku", "errors", "flash_rule",
+    )
+
+    def __init__(self, link, nome, prezzo="N/A", disponibilita="N/A", contingente="N/A",
+                 data_disponibilita="N/A", finitura="N/A", metallo="N/A", peso="N/A",
+                 in_vendita_da="N/A", shop="ipzs"):
+        self.shop               = shop
+        self.link               = link
+        self.nome               = nome
+        self.prezzo             = prezzo
+        self.disponibilita      = disponibilita
+        self.contingente        = contingente
+        self.data_disponibilita = data_disponibilita
+        self.finitura           = finitura
+        self.metallo            = metallo
+        self.peso               = peso
+        self.in_vendita_da      = in_vendita_da
+        self.flash_rule         = None
+        self.errors             = {}
+
+        self.availability = Availability.parse(disponibilita)
+        self.sku          = canonical_sku(link, shop)
+        self.tiratura     = self._parse("contingente", parse_tiratura, contingente)
+        self.price        = self._parse("prezzo", _price, prezzo)
+        self.release      = self._parse("data_disponibilita", parse_date, data_disponibilita)
+
+    def _parse(self, field, fn, txt):
+        try:
+            value = fn(txt or "")
+        except Exception:
+            value = None
+        if value is None:
+            self.errors[field] = txt
+        return value
+
+    @property
+    def available(self):
+        return self.availability is not Availability.NOT_AVAILABLE
+
+    @property
+    def text(self):
+        # testo per le keyword delle regole flash-cart
+        return f"{normalize_text(self.nome)} {normalize_text(self.finitura)}"
+
+    # ─────────── Round-trip (cache HTTP / state store)
+    @classmethod
+    def from_dict(cls, d, shop="ipzs"):
+        return cls(shop=shop, **{attr: d[key] for key, attr in FIELDS.items() if key in d})
+
+    def to_dict(self):
+        return {key: getattr(self, attr) for key, attr in FIELDS.items()}
+
+    # ─────────── Compatibilità con l'accesso a dict
+    def __getitem__(self, key):
+        if key == "flash_rule":
+            return self.flash_rule
+        try:
+            return getattr(self, FIELDS[key])
+        except KeyError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self):
+        return f"Product({self.shop}:{self.sku} {self.nome!r} {self.price} {self.availability.name})"
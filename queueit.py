@@ -0,0 +1,166 @@
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from metrics import metrics
+
+# ──────────────── Queue-it: sessioni browser "parcheggiate" in coda
+QUEUE_TIMEOUT = 300    # s massimi in coda prima di rinunciare
+POLL          = 2.0    # s tra due controlli dell'URL dei driver in coda
+
+QUEUED = object()      # ritornato da un'azione browser che è finita su Queue-it
+
+
+def completed(result):
+    # Future già risolto, per i percorsi che non passano dal browser
+    done = Future()
+    done.set_result(result)
+    return done
+
+
+def in_queue(driver):
+    try:
+        return "queue-it" in driver.current_url.lower()
+    except Exception:
+        return False
+
+
+class _Task:
+    __slots__ = ("fn", "future", "label", "on_timeout")
+
+    def __init__(self, fn, future, label, on_timeout):
+        self.fn         = fn
+        self.future     = future
+        self.label      = label
+        self.on_timeout = on_timeout
+
+
+class _Parked:
+    __slots__ = ("driver", "task", "pending", "since", "deadline", "resuming")
+
+    def __init__(self, driver, task, timeout):
+        self.driver   = driver
+        self.task     = task
+        self.pending  = []          # azioni arrivate per lo stesso driver nel frattempo
+        self.since    = time.monotonic()
+        self.deadline = self.since + timeout
+        self.resuming = False
+
+
+class QueueItPark:
+    """
+    Le azioni browser girano tramite submit(driver, fn): se fn ritorna QUEUED
+    il driver resta in coda in background, un solo thread ne controlla l'URL
+    e all'uscita dalla coda fn viene rilanciata (callback di ripresa), seguita
+    dalle azioni accodate nel frattempo per lo stesso driver. Chi chiama riceve
+    subito un Future e prosegue con altri prodotti/shop. Ogni attesa viene
+    registrata in `waits` come (label, secondi in coda, esito).
+    """
+
+    def __init__(self, timeout=QUEUE_TIMEOUT, poll=POLL):
+        self.timeout  = timeout
+        self.poll     = poll
+        self.lock     = threading.Lock()
+        self.parked   = {}          # id(driver) → _Parked
+        self.waits    = []
+        self.thread   = None
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="queueit")
+
+    def submit(self, driver, fn, label="", on_timeout=False):
+        """Esegue fn(driver) ora, o dopo la coda se il driver è parcheggiato. Ritorna un Future."""
+        task = _Task(fn, Future(), label, on_timeout)
+        with self.lock:
+            parked = self.parked.get(id(driver))
+            if parked:
+                # driver in coda (o in ripresa): l'azione parte dopo, nello stesso ordine
+                parked.pending.append(task)
+                return task.future
+        if self._run(driver, task):
+            self._park(driver, task)
+        return task.future
+
+    def wait(self, driver, label="", timeout=None):
+        """Attesa bloccante (es. login: senza sessione non c'è altro da fare). True se uscito."""
+        started = time.monotonic()
+        deadline = started + (timeout or self.timeout)
+        print(f"⏳ Queue-it ({label}): attendo uscita dalla coda...")
+        while in_queue(driver):
+            if time.monotonic() > deadline:
+                self._record(label, started, "timeout")
+                return False
+            time.sleep(self.poll)
+        self._record(label, started, "released")
+        return True
+
+    # ─────────── Interni
+    def _run(self, driver, task):
+        """Esegue un'azione; True se è finita su Queue-it e va parcheggiata."""
+        try:
+            result = task.fn(driver)
+        except Exception as e:
+            task.future.set_exception(e)
+            return False
+        if result is QUEUED:
+            return True
+        task.future.set_result(result)
+        return False
+
+    def _park(self, driver, task):
+        print(f"⏳ Queue-it ({task.label}): sessione parcheggiata, proseguo con il resto")
+        with self.lock:
+            self.parked[id(driver)] = _Parked(driver, task, self.timeout)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._watch, name="queueit-watch", daemon=True)
+                self.thread.start()
+
+    def _watch(self):
+        while True:
+            with self.lock:
+                entries = [p for p in self.parked.values() if not p.resuming]
+                if not self.parked:
+                    self.thread = None
+                    return
+            now = time.monotonic()
+            for p in entries:
+                if not in_queue(p.driver):
+                    self._record(p.task.label, p.since, "released")
+                    p.resuming = True
+                    self.executor.submit(self._resume, p)
+                elif now > p.deadline:
+                    self._record(p.task.label, p.since, "timeout")
+                    with self.lock:
+                        self.parked.pop(id(p.driver), None)
+                        tasks = [p.task] + p.pending
+                    for task in tasks:
+                        task.future.set_result(task.on_timeout)
+            time.sleep(self.poll)
+
+    def _resume(self, p):
+        # callback di ripresa: rilancia l'azione interrotta, poi quelle accodate
+        task = p.task
+        while True:
+            if self._run(p.driver, task):
+                with self.lock:
+                    p.task, p.resuming = task, False
+                    p.since = time.monotonic()
+                    p.deadline = p.since + self.timeout
+                print(f"⏳ Queue-it ({task.label}): di nuovo in coda")
+                return
+            with self.lock:
+                if not p.pending:
+                    self.parked.pop(id(p.driver), None)
+                    return
+                task = p.pending.pop(0)
+
+    def _record(self, label, since, outcome):
+        waited = round(time.monotonic() - since, 1)
+        with self.lock:
+            self.waits.append((label, waited, outcome))
+        metrics.observe("queueit_wait", waited)
+        if outcome != "released":
+            metrics.reject("queueit_timeout")
+        icon = "✅" if outcome == "released" else "❌"
+        print(f"{icon} Queue-it ({label}): {outcome} dopo {waited}s in coda")
+
+
+park = QueueItPark()
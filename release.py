@@ -0,0 +1,161 @@
+import os
+import re
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+import ipzs
+from rules import ACTION_CART
+from fetch import engine
+from browser_pool import pool, ipzs_key
+from state import open_store
+
+# ──────────────── Calendario uscite IPZS + burst al go-live
+RELEASE_TIME  = os.getenv("IPZS_RELEASE_TIME", "10:00")   # se la pagina non indica l'ora
+PREWARM_LEAD  = timedelta(minutes=10)   # browser loggato pronto prima dell'uscita
+WINDOW_BEFORE = timedelta(minutes=3)    # il polling parte poco prima del go-live
+WINDOW_AFTER  = timedelta(minutes=30)   # e si ferma comunque dopo
+POLL_INTERVAL = 2.0                     # s tra due giri sui soli prodotti in uscita
+HORIZON       = timedelta(hours=24)     # uscite considerate dal daemon
+CRON_TICK     = timedelta(minutes=int(os.getenv("CRON_TICK_MIN", "20")))  # passo del cron bot.yml
+RELEASE_DONE  = "done"                  # lease chiuso: uscita gestita, niente altri burst
+
+TIME_RE = re.compile(r"\b(\d{1,2})[:.](\d{2})\b")
+
+
+def go_live(p):
+    """Data e ora d'uscita: data disponibilita + ora (da "in vendita da" se presente)."""
+    if p.release is None:
+        return None
+    m = TIME_RE.search(p.in_vendita_da or "") or TIME_RE.search(p.data_disponibilita or "")
+    hh, mm = (int(m.group(1)), int(m.group(2))) if m else map(int, RELEASE_TIME.split(":"))
+    return p.release.replace(hour=hh, minute=mm, second=0, microsecond=0)
+
+
+def build_calendar(products, now=None, horizon=HORIZON):
+    """
+    Uscite imminenti → prodotti non ancora disponibili che le regole
+    flash-cart manderebbero al carrello.
+    """
+    now = now or datetime.now()
+    pending = [p for p in products if not p.available]
+    calendar = {}
+    for p, rule in zip(pending, ipzs.match_flash_rules(pending)):
+        if rule is None or rule.action != ACTION_CART:
+            continue
+        t = go_live(p)
+        if t and now - WINDOW_AFTER < t <= now + horizon:
+            calendar.setdefault(t, []).append(p)
+    return calendar
+
+
+def next_tick(now=None, every=CRON_TICK):
+    """Prossimo tick di un cron */N minuti: il burst di un run cron si ferma lì."""
+    now  = (now or datetime.now()).replace(second=0, microsecond=0)
+    step = int(every.total_seconds() // 60)
+    return now + timedelta(minutes=step - now.minute % step)
+
+
+# ──────────────── Lease delle uscite nello state store
+# meta["release:<go-live>"] = fine del burst in corso (ISO) oppure RELEASE_DONE.
+# Un run che trova un lease non scaduto salta l'uscita: due processi non
+# fanno polling (e carrello) sullo stesso go-live; alla scadenza il run
+# successivo riprende il burst da dove l'altro si è fermato.
+def _lease_key(t):
+    return f"release:{t:%Y%m%d%H%M}"
+
+
+def claim(t, until, now=None):
+    now  = now or datetime.now()
+    meta = open_store().meta
+    held = meta.get(_lease_key(t))
+    if held == RELEASE_DONE or (held and held > now.isoformat(timespec="seconds")):
+        return False
+    meta[_lease_key(t)] = until.isoformat(timespec="seconds")
+    return True
+
+
+def _close(t, done):
+    meta = open_store().meta
+    if done:
+        meta[_lease_key(t)] = RELEASE_DONE
+    else:
+        # fermato dall'esterno (shutdown del daemon): l'uscita resta libera
+        meta.pop(_lease_key(t), None)
+
+
+def watch_release(t, products, stop=None, until=None):
+    """
+    Burst su un'uscita: pre-riscalda il driver IPZS, poi riscarica a raffica
+    solo i prodotti in uscita e li passa al flash-cart appena diventano disponibili.
+    Con `until` (run cron) il burst si ferma comunque lì, al tick successivo.
+    """
+    stop = stop or threading.Event()
+    end  = min(t + WINDOW_AFTER, until) if until else t + WINDOW_AFTER
+    pending = {p.link: p for p in products}
+    names = ", ".join(p.nome for p in products)
+    print(f"📅 Uscita {t:%d/%m %H:%M}: {len(pending)} prodotti in osservazione ({names})")
+
+    if stop.wait(max(0, (t - PREWARM_LEAD - datetime.now()).total_seconds())):
+        return _close(t, False)
+    if os.getenv("IPZS_USERNAME"):
+        pool.prewarm(ipzs_key(), ipzs.login_ipzs, 1)
+
+    if stop.wait(max(0, (t - WINDOW_BEFORE - datetime.now()).total_seconds())):
+        return _close(t, False)
+    print(f"🚀 Burst uscita {t:%H:%M}: polling ogni {POLL_INTERVAL}s fino alle {end:%H:%M}")
+
+    async def poll(links):
+        return await asyncio.gather(*(ipzs.ascrape_ipzs(l) for l in links))
+
+    while pending and datetime.now() < end:
+        live = [p for p in engine.run(poll(list(pending))) if p and p.available]
+        if live:
+            print(f"🟢 Online: {[p.nome for p in live]}")
+            ipzs.flash_ipzs_cart(live)
+            for p in live:
+                pending.pop(p.link, None)
+        if stop.wait(POLL_INTERVAL):
+            return _close(t, False)
+
+    if pending and end < t + WINDOW_AFTER:
+        # tick cron: il lease scade ora e il run successivo riprende il burst
+        print(f"⏭️ Burst uscita {t:%H:%M} passato al prossimo run: {len(pending)} prodotti in attesa")
+        return
+    if pending:
+        print(f"⌛ Fine finestra uscita {t:%H:%M}: ancora non disponibili {len(pending)} prodotti")
+    _close(t, True)
+
+
+class ReleaseScheduler:
+    """
+    Un thread di burst per uscita, avviato una volta sola per go-live: in
+    questo processo tramite `threads`, tra processi tramite il lease nello store.
+    `until` chiude tutti i burst a un'ora fissa (il prossimo tick del cron).
+    """
+
+    def __init__(self, stop=None, until=None):
+        self.stop    = stop or threading.Event()
+        self.until   = until
+        self.threads = {}
+
+    def plan(self, products, horizon=HORIZON):
+        for t, prods in build_calendar(products, horizon=horizon).items():
+            if t in self.threads:
+                # uscita già in osservazione (o gestita) in questo processo
+                continue
+            lease = min(t + WINDOW_AFTER, self.until) if self.until else t + WINDOW_AFTER
+            if not claim(t, lease):
+                print(f"🔒 Uscita {t:%d/%m %H:%M} già in burst in un altro run")
+                continue
+            th = threading.Thread(
+                target=watch_release, args=(t, prods, self.stop, self.until),
+                name=f"release-{t:%m%d%H%M}", daemon=True,
+            )
+            self.threads[t] = th
+            th.start()
+        return [th for th in self.threads.values() if th.is_alive()]
+
+    def join(self):
+        for th in self.threads.values():
+            th.join()
@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+from state import open_store
+from http_cache import cache
+from product import Product
+
+# ──────────────── Scheduler ricontrolli sniper
+MIN_INTERVAL  = 10 * 60            # s: link appena cambiati / uscita imminente
+BASE_INTERVAL = 6 * 3600           # s: primo intervallo (come il vecchio should_check)
+MAX_INTERVAL  = 7 * 24 * 3600      # s: tetto per i link morti da tempo
+CARTED_MIN    = 24 * 3600          # s: già nel carrello, non serve insistere
+BACKOFF       = 2.0                # stato invariato → intervallo ×2
+RECENT_CHANGE = timedelta(days=3)  # cambiato da poco → intervallo stretto
+RECENT_CAP    = 3600               # s: tetto dell'intervallo nei giorni dopo un cambio
+RELEASE_NEAR  = timedelta(hours=48)
+RUN_BUDGET    = 40                 # controlli massimi per run
+
+
+class RevisitScheduler:
+    """
+    Intervallo di ricontrollo per link appreso dallo storico: raddoppia a ogni
+    controllo con stato invariato (fino a MAX_INTERVAL), torna al minimo quando
+    lo stato cambia o l'uscita è vicina. Ogni run controlla al più `budget`
+    link, partendo da quelli più in ritardo rispetto al proprio intervallo.
+    """
+
+    def __init__(self, store=None, budget=RUN_BUDGET):
+        self.store  = store or open_store()
+        self.table  = self.store.revisit
+        self.budget = budget
+
+    def _release_near(self, link, now):
+        info = cache.parsed(link, "product")
+        if not info:
+            return False
+        release = Product.from_dict(info).release
+        return release is not None and now - timedelta(hours=24) <= release <= now + RELEASE_NEAR
+
+    def _urgency(self, link, now, legacy):
+        """Ritardo relativo (>= 0 se il link è da controllare), None se non dovuto."""
+        row = self.table.get(link)
+        if row is None:
+            # link mai schedulato: regola storica di should_check, priorità massima
+            return float("inf") if legacy(link) else None
+        due = datetime.fromisoformat(row["next_due"])
+        if self._release_near(link, now):
+            due = min(due, now)
+        late = (now - due).total_seconds()
+        if late < 0:
+            return None
+        return late / row["interval"]
+
+    def due(self, links, legacy=lambda link: True, now=None):
+        """Link da controllare in questo run, al più `budget`, i più urgenti prima."""
+        now = now or datetime.now()
+        scored = []
+        for link in links:
+            u = self._urgency(link, now, legacy)
+            if u is not None:
+                scored.append((u, link))
+        scored.sort(reverse=True)
+        picked = [link for _, link in scored[:self.budget]]
+        if len(scored) > len(picked):
+            print(f"🎯 Budget sniper: {len(picked)}/{len(scored)} link dovuti controllati in questo run")
+        return picked
+
+    def observe(self, link, status, now=None):
+        """Registra l'esito di un controllo e calcola il prossimo."""
+        now = now or datetime.now()
+        row = self.table.get(link)
+        if row is None:
+            interval, last_change, checks = BASE_INTERVAL, None, 0
+        else:
+            interval, last_change, checks = row["interval"], row.get("last_change"), row["checks"]
+
+        if row is not None and row.get("last_status") != status:
+            interval, last_change = MIN_INTERVAL, now.isoformat()
+        elif row is not None:
+            interval = min(MAX_INTERVAL, interval * BACKOFF)
+
+        if last_change and now - datetime.fromisoformat(last_change) < RECENT_CHANGE:
+            interval = min(interval, RECENT_CAP)
+        if self._release_near(link, now):
+            interval = MIN_INTERVAL
+        if status == "AVAILABLE_CARTED":
+            interval = max(interval, CARTED_MIN)
+
+        self.table[link] = {
+            "interval":    interval,
+            "next_due":    (now + timedelta(seconds=interval)).isoformat(),
+            "last_status": status,
+            "last_change": last_change,
+            "checks":      checks + 1,
+        }
@@ -0,0 +1,99 @@
+import os
+import re
+import json
+from collections import Counter
+
+# ──────────────── Regole flash-cart IPZS (tabella in flash_rules.json)
+RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "flash_rules.json")
+
+ACTION_CART  = "cart"    # add-to-cart automatico + alert
+ACTION_ALERT = "alert"   # solo alert Telegram
+
+
+class Rule:
+    """
+    Regola compilata: soglie massime su tiratura e prezzo, gruppi di keyword
+    (ogni gruppo deve avere almeno un match nel testo nome + finitura) e azione.
+    """
+
+    __slots__ = ("name", "max_tiratura", "max_prezzo", "keywords", "action")
+
+    def __init__(self, name, max_tiratura=None, max_prezzo=None, keywords=(), action=ACTION_ALERT):
+        if action not in (ACTION_CART, ACTION_ALERT):
+            raise ValueError(f"Regola {name}: azione sconosciuta {action!r}")
+        self.name         = name
+        self.max_tiratura = max_tiratura
+        self.max_prezzo   = max_prezzo
+        self.keywords     = [
+            re.compile("|".join(re.escape(k.lower()) for k in group)) for group in keywords
+        ]
+        self.action       = action
+
+
+class RuleSet:
+    """
+    Regole valutate in ordine (vince la prima) su tutto il batch di prodotti
+    in un colpo solo: colonne numeriche già parsate, ogni regola filtra solo i
+    prodotti non ancora assegnati. Il file viene ricaricato se cambia su disco.
+    """
+
+    def __init__(self, path=RULES_FILE):
+        self.path  = path
+        self.rules = []
+        self.hits  = Counter()
+        self.mtime = None
+        self.refresh()
+
+    def refresh(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            print(f"⚠️ {self.path} non trovato: nessuna regola flash-cart attiva")
+            self.rules, self.mtime = [], None
+            return
+        if mtime == self.mtime:
+            return
+        # segno comunque il mtime: un file rotto non viene riletto a ogni batch
+        self.mtime = mtime
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                rules = [Rule(**r) for r in json.load(f)]
+        except (ValueError, TypeError, AttributeError, OSError) as e:
+            # file a metà scrittura o regola malformata: restano le regole di prima
+            print(f"⚠️ {self.path} non valido ({e}): restano le regole {[r.name for r in self.rules]}")
+            return
+        self.rules = rules
+        print(f"📐 Regole flash-cart caricate: {[r.name for r in self.rules]}")
+
+    def evaluate(self, tirature, prezzi, testi):
+        """
+        Colonne parallele (tiratura, prezzo, testo minuscolo) → per ogni
+        prodotto la Rule che scatta, oppure None.
+        """
+        self.refresh()
+        out = [None] * len(tirature)
+        pending = [i for i in range(len(tirature)) if tirature[i] is not None and prezzi[i] is not None]
+
+        for rule in self.rules:
+            if not pending:
+                break
+            mt, mp = rule.max_tiratura, rule.max_prezzo
+            rest = []
+            for i in pending:
+                if (
+                    (mt is None or tirature[i] <= mt)
+                    and (mp is None or prezzi[i] <= mp)
+                    and all(k.search(testi[i]) for k in rule.keywords)
+                ):
+                    out[i] = rule
+                    self.hits[rule.name] += 1
+                else:
+                    rest.append(i)
+            pending = rest
+        return out
+
+    def stats(self):
+        return ", ".join(f"{r.name}={self.hits[r.name]}" for r in self.rules)
+
+
+flash_rules = RuleSet()
@@ -0,0 +1,217 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime
+
+from fetch import build_session, HEADERS
+
+# ──────────────── Vault sessioni (cookie + storage condivisi tra Selenium e requests)
+VAULT_FILE   = "session_vault.json"
+VERSION      = 1
+LIVENESS_TTL = 5 * 60   # s: una sessione appena verificata non si riverifica
+
+SHOPS = {
+    "ipzs": {
+        "base":     "https://www.shop.ipzs.it/it/",
+        # sezione customer-data Magento: JSON piccolo, "fullname" solo se loggati
+        "liveness": "https://www.shop.ipzs.it/it/customer/section/load/?sections=customer",
+        "auth":     ("PHPSESSID",),
+    },
+}
+
+
+def _vault_key(key):
+    shop, user = key
+    return f"{shop}:{user or ''}"
+
+
+def _from_jar(c):
+    # Cookie di http.cookiejar → stesso formato di driver.get_cookies()
+    cookie = {
+        "name":     c.name,
+        "value":    c.value,
+        "domain":   c.domain,
+        "path":     c.path,
+        "secure":   bool(c.secure),
+        "httpOnly": c.has_nonstandard_attr("HttpOnly"),
+    }
+    if c.expires:
+        cookie["expiry"] = int(c.expires)
+    return cookie
+
+
+def _expired(cookie, now):
+    return "expiry" in cookie and cookie["expiry"] <= now
+
+
+class SessionVault:
+    """
+    Sessioni loggate per (shop, account) in un JSON versionato: cookie nel
+    formato WebDriver + local/session storage. Si sincronizza nei due sensi
+    con i driver Selenium e con le requests.Session, scarta i cookie scaduti
+    e verifica che la sessione sia ancora valida con una sola GET leggera.
+    """
+
+    def __init__(self, path=VAULT_FILE):
+        self.path    = path
+        self.lock    = threading.RLock()
+        self.entries = {}
+        self.load()
+
+    # ─────────── Persistenza
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Vault sessioni illeggibile, riparto vuoto: {e}")
+            return
+        if data.get("version") != VERSION:
+            print(f"⚠️ Vault sessioni versione {data.get('version')} non supportata, ignorato")
+            return
+        self.entries = data.get("sessions", {})
+
+    def save(self):
+        with self.lock:
+            text = json.dumps({"version": VERSION, "sessions": self.entries}, indent=2)
+            tmp = self.path + ".tmp"
+            # cookie di login: leggibili solo dall'utente del bot
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, self.path)
+
+    # ─────────── Stato
+    def _entry(self, key):
+        return self.entries.get(_vault_key(key))
+
+    def cookies(self, key):
+        """Cookie non scaduti della sessione (lista vuota se assente)."""
+        entry = self._entry(key)
+        if not entry:
+            return []
+        now = time.time()
+        return [c for c in entry["cookies"] if not _expired(c, now)]
+
+    def expires_at(self, key):
+        """Scadenza (epoch) dei cookie di autenticazione, None se di sessione o assenti."""
+        auth = SHOPS[key[0]]["auth"]
+        expiries = [c["expiry"] for c in self.cookies(key) if c["name"] in auth and "expiry" in c]
+        return min(expiries) if expiries else None
+
+    def _update(self, key, cookies, storage=None, checked=False):
+        with self.lock:
+            entry = self.entries.setdefault(_vault_key(key), {"cookies": [], "storage": {}})
+            merged = {(c["name"], c.get("domain"), c.get("path", "/")): c for c in entry["cookies"]}
+            merged.update({(c["name"], c.get("domain"), c.get("path", "/")): c for c in cookies})
+            now = time.time()
+            entry["cookies"] = [c for c in merged.values() if not _expired(c, now)]
+            if storage is not None:
+                entry["storage"] = storage
+            entry["saved_at"] = int(now)
+            if checked:
+                entry["checked_at"] = int(now)
+            self.save()
+
+    def invalidate(self, key):
+        with self.lock:
+            if self.entries.pop(_vault_key(key), None) is not None:
+                self.save()
+                print(f"🧹 Sessione {_vault_key(key)} rimossa dal vault")
+
+    # ─────────── Sync con requests
+    def from_session(self, key, session):
+        self._update(key, [_from_jar(c) for c in session.cookies])
+
+    def to_session(self, key, session=None):
+        session = session or build_session()
+        for c in self.cookies(key):
+            session.cookies.set(
+                c["name"], c["value"],
+                domain=c.get("domain"), path=c.get("path", "/"),
+                secure=c.get("secure", False), expires=c.get("expiry"),
+                rest={"HttpOnly": None} if c.get("httpOnly") else {},
+            )
+        return session
+
+    def session(self, key):
+        """requests.Session già autenticata, o None se il vault non ha una sessione viva."""
+        if not self.alive(key):
+            return None
+        return self.to_session(key)
+
+    # ─────────── Sync con Selenium
+    def from_driver(self, key, driver):
+        try:
+            storage = {
+                "localStorage":   driver.execute_script("return {...localStorage};"),
+                "sessionStorage": driver.execute_script("return {...sessionStorage};"),
+            }
+        except Exception:
+            storage = None
+        # sessione appena usata dal browser loggato: vale come verifica
+        self._update(key, driver.get_cookies(), storage, checked=True)
+        exp = self.expires_at(key)
+        until = f"scade {datetime.fromtimestamp(exp):%d/%m %H:%M}" if exp else "cookie di sessione"
+        print(f"🍪 Sessione {_vault_key(key)} salvata nel vault ({until})")
+
+    def to_driver(self, key, driver):
+        """Cookie e storage nel browser; il driver deve poi ricaricare la pagina che serve."""
+        entry = self._entry(key)
+        cookies = self.cookies(key)
+        if not cookies:
+            return False
+        try:
+            # add_cookie accetta solo cookie del dominio corrente
+            driver.get(SHOPS[key[0]]["base"])
+            for c in cookies:
+                try:
+                    driver.add_cookie({k: v for k, v in c.items() if k != "sameSite"})
+                except Exception:
+                    pass
+            for area in ("localStorage", "sessionStorage"):
+                for k, v in entry.get("storage", {}).get(area, {}).items():
+                    driver.execute_script(f"window.{area}.setItem(arguments[0], arguments[1]);", k, v)
+            return True
+        except Exception as e:
+            print(f"⚠️ Ripristino sessione nel browser fallito: {e}")
+            return False
+
+    # ─────────── Verifica
+    def alive(self, key, force=False):
+        """True se la sessione è ancora loggata (una GET, poi cache per LIVENESS_TTL)."""
+        entry = self._entry(key)
+        if not entry:
+            return False
+        auth = SHOPS[key[0]]["auth"]
+        if not any(c["name"] in auth for c in self.cookies(key)):
+            return False
+        now = time.time()
+        if not force and now - entry.get("checked_at", 0) < LIVENESS_TTL:
+            return True
+
+        session = self.to_session(key)
+        try:
+            r = session.get(
+                SHOPS[key[0]]["liveness"],
+                headers={**HEADERS, "X-Requested-With": "XMLHttpRequest"},
+                timeout=(3, 6),
+            )
+            ok = r.status_code == 200 and bool(r.json().get("customer", {}).get("fullname"))
+        except Exception as e:
+            print(f"⚠️ Verifica sessione {_vault_key(key)} fallita: {e}")
+            return False
+
+        if not ok:
+            print(f"🔒 Sessione {_vault_key(key)} scaduta")
+            self.invalidate(key)
+            return False
+        # cookie eventualmente rinnovati dal server
+        self._update(key, [_from_jar(c) for c in session.cookies], checked=True)
+        return True
+
+
+vault = SessionVault()
@@ -0,0 +1,179 @@
+import asyncio
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+import ipzs
+import mtm
+import catalog
+import extract
+import sitemap
+from fetch import engine
+from http_cache import cache
+from metrics import metrics
+from state import open_store
+
+# ──────────────── Adapter shop + orchestratore
+
+
+class Shop(ABC):
+    """
+    Adapter di uno shop: trova i link prodotto (discover), li trasforma in
+    Product (scrape), riconosce le pagine buone (validate), fa login e
+    carrello sui driver del pool. `run()` è il giro completo costruito su
+    questi passi (catalogo → notifiche → carrello → salvataggio):
+    l'orchestratore lo lancia in parallelo per tutti gli shop sullo stesso
+    motore HTTP e sullo stesso pool di browser.
+    """
+
+    name = None
+
+    @abstractmethod
+    async def discover(self):
+        """Link prodotto da controllare in questo giro."""
+
+    @abstractmethod
+    async def scrape(self, link):
+        """Product del link, None se la pagina non è utilizzabile."""
+
+    def validate(self, content):
+        return extract.is_valid(content)
+
+    @abstractmethod
+    def login(self, driver, **account):
+        """Login sul driver del pool; True se riuscito."""
+
+    @abstractmethod
+    def cart(self, products):
+        """Carrello (e notifica) per i prodotti che lo meritano."""
+
+    def notify(self, products):
+        pass
+
+    def save(self):
+        open_store().export()
+
+    async def sweep(self):
+        links = await self.discover()
+        products = await asyncio.gather(*(self.scrape(link) for link in links))
+        return [p for p in products if p]
+
+    def collect(self):
+        return engine.run(self.sweep())
+
+    def run(self, **opts):
+        products = self.collect(**opts)
+        with metrics.phase("notify"):
+            self.notify(products)
+        if products:
+            self.cart(products)
+        # SALVA SUBITO (export dei file di stato modificati)
+        self.save()
+        return products
+
+
+class IpzsShop(Shop):
+    name = "ipzs"
+
+    async def discover(self):
+        # categorie + sitemap, senza fingerprint: sweep() li sovrappone agli scrape
+        found = await asyncio.gather(
+            *(ipzs.aget_links(u) for u in ipzs.CATEGORY_URLS), sitemap.discover()
+        )
+        return sorted({link for links in found for link in links})
+
+    async def scrape(self, link):
+        return await ipzs.ascrape_ipzs(link)
+
+    def validate(self, content):
+        return ipzs.is_valid_ipzs_page(content)
+
+    def login(self, driver, **account):
+        return ipzs.login_ipzs(driver)
+
+    def cart(self, products):
+        ipzs.flash_ipzs_cart(products)
+
+    def notify(self, products):
+        store = open_store()
+        ipzs.notify_new(products, store.links("new"))
+        ipzs.notify_low(products, store.links("low"))
+        ipzs.notify_dates(products, store.date_alerts)
+
+    def save(self):
+        super().save()
+        cache.save()
+
+    async def sweep(self, with_spider=False):
+        # ogni prodotto parte appena categoria/sitemap/spider lo trova, con i
+        # fingerprint del listing per saltare gli scrape invariati
+        return await ipzs.sweep_ipzs(
+            ipzs.CATEGORY_URLS, with_spider=with_spider, scrape_product=self.scrape
+        )
+
+    def collect(self, with_spider=None, max_age=None):
+        # snapshot condiviso se abbastanza fresco e con sitemap (uno delle sole
+        # categorie non basta), altrimenti sweep che diventa il nuovo snapshot
+        if with_spider is None:
+            with_spider = ipzs.spider_allowed()
+        if max_age is None:
+            max_age = timedelta(0) if with_spider else catalog.MAX_AGE
+        snap = catalog.current(
+            lambda: engine.run(self.sweep(with_spider)),
+            "main", max_age, coverage="spider" if with_spider else "sitemap",
+        )
+        return snap.products if snap else []
+
+
+class MtmShop(Shop):
+    name = "mtm"
+
+    def __init__(self):
+        self.seen  = None
+        self.found = {}
+
+    async def discover(self):
+        print("ℹ️ Avvio controllo MTM Monaco")
+        self.seen = open_store().links("mtm")
+        print(f"🧾 Link già visti: {len(self.seen)}")
+        products = await mtm.ascan_mtm_monaco(self.seen)
+        self.found = {p.link: p for p in products}
+        return list(self.found)
+
+    async def scrape(self, link):
+        # il listing MTM ha già titolo e prezzo: nessuna pagina prodotto da scaricare
+        return self.found.get(link)
+
+    def validate(self, content):
+        return bool(mtm.mtm_categories(content))
+
+    def login(self, driver, user=None, pwd=None):
+        return mtm.login_mtm(driver, username=user, password=pwd)
+
+    def cart(self, products):
+        mtm.handle_mtm_checkout(products, self.seen)
+
+
+IPZS = IpzsShop()
+MTM  = MtmShop()
+SHOPS = [IPZS, MTM]
+
+
+def run_shops(shops=None):
+    """
+    Un thread per shop, tutti insieme: il controllo MTM non aspetta più il
+    carrello IPZS e un nuovo shop non allunga il run. Ritorna {nome: prodotti}.
+    """
+    shops = shops or SHOPS
+    results = {}
+    with ThreadPoolExecutor(max_workers=len(shops), thread_name_prefix="shop") as executor:
+        futures = {executor.submit(shop.run): shop for shop in shops}
+        for future in as_completed(futures):
+            shop = futures[future]
+            try:
+                results[shop.name] = future.result()
+            except Exception as e:
+                print(f"❌ Shop {shop.name} fallito: {e}")
+                results[shop.name] = []
+            print(f"🏁 Shop {shop.name}: {len(results[shop.name])} prodotti")
+    return results
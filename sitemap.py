@@ -0,0 +1,155 @@
+import zlib
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta
+
+import spider
+from fetch import engine
+from state import open_store
+from http_cache import cache
+
+# ──────────────── Scoperta prodotti da sitemap XML
+ROBOTS_URL    = "https://www.shop.ipzs.it/robots.txt"
+DEFAULT_ROOTS = ["https://www.shop.ipzs.it/sitemap.xml"]
+ROBOTS_TTL    = timedelta(days=1)    # le radici da robots.txt cambiano di rado
+SEED_DAYS     = 14                   # primo giro: solo prodotti modificati di recente
+CHUNK         = 16 * 1024
+
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def iter_sitemap(chunks):
+    """
+    Parsing incrementale di una sitemap (urlset o sitemapindex, anche .gz):
+    genera (tipo, loc, lastmod) man mano che arrivano i chunk, senza tenere
+    in memoria l'intero documento. tipo è "url" oppure "sitemap".
+    """
+    parser  = ET.XMLPullParser(events=("end",))
+    inflate = None
+    first   = True
+    for chunk in chunks:
+        if first:
+            first = False
+            if chunk[:2] == b"\x1f\x8b":
+                inflate = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if inflate:
+            chunk = inflate.decompress(chunk)
+        parser.feed(chunk)
+        for _, el in parser.read_events():
+            kind = _local(el.tag)
+            if kind not in ("url", "sitemap"):
+                continue
+            loc = lastmod = None
+            for child in el:
+                name = _local(child.tag)
+                if name == "loc":
+                    loc = (child.text or "").strip()
+                elif name == "lastmod":
+                    lastmod = (child.text or "").strip()
+            el.clear()
+            if loc:
+                yield kind, loc, lastmod
+
+
+def _parse_lastmod(value):
+    try:
+        d = datetime.fromisoformat(value)
+        return d.replace(tzinfo=None)
+    except (TypeError, ValueError):
+        return None
+
+
+async def _roots(meta):
+    now = datetime.now()
+    cached = meta.get("sitemap_roots")
+    if cached and now - datetime.fromisoformat(meta["sitemap_roots_ts"]) < ROBOTS_TTL:
+        return cached.split()
+    roots = []
+    try:
+        r = await engine.get(ROBOTS_URL)
+        if r.status_code == 200:
+            roots = [
+                line.split(":", 1)[1].strip()
+                for line in r.text.splitlines()
+                if line.lower().startswith("sitemap:")
+            ]
+    except Exception as e:
+        print(f"⚠️ robots.txt non raggiungibile: {e}")
+    roots = roots or DEFAULT_ROOTS
+    meta["sitemap_roots"] = " ".join(roots)
+    meta["sitemap_roots_ts"] = now.isoformat()
+    return roots
+
+
+async def _fetch(url):
+    """Entry della sitemap in streaming: [] se invariata (304), None se errore."""
+    try:
+        r = await engine.get(url, headers={**engine.headers, **cache.validators(url)}, stream=True)
+    except Exception as e:
+        print(f"⚠️ Sitemap {url}: {e}")
+        return None
+    if r.status_code == 304:
+        r.close()
+        return []
+    if r.status_code != 200:
+        print(f"⚠️ Sitemap {url}: status {r.status_code}")
+        r.close()
+        return None
+    cache.remember(url, r)
+
+    def read():
+        with r:
+            return list(iter_sitemap(r.iter_content(CHUNK)))
+    return await engine.to_thread(read)
+
+
+async def discover():
+    """
+    URL prodotto nuovi o con <lastmod> cambiato rispetto al giro precedente.
+    Sitemap indice e figlie invariate (304 o stesso lastmod) non vengono rilette.
+    """
+    store   = open_store()
+    known   = store.sitemap
+    seeding = len(known) == 0
+    cutoff  = datetime.now() - timedelta(days=SEED_DAYS)
+    now     = datetime.now().isoformat(timespec="seconds")
+
+    queue = [(url, None) for url in await _roots(store.meta)]
+    done, found, updates = set(), [], []
+    while queue:
+        url, url_lastmod = queue.pop()
+        if url in done:
+            continue
+        done.add(url)
+        entries = await _fetch(url)
+        if entries is None:
+            continue
+        if url_lastmod:
+            updates.append((url, url_lastmod, now))
+        for kind, loc, lastmod in entries:
+            if kind == "sitemap":
+                # figlia con lo stesso lastmod dell'ultima lettura: niente da fare
+                if not lastmod or known.get(loc, {}).get("lastmod") != lastmod:
+                    queue.append((loc, lastmod))
+                continue
+
+            link = spider.normalize(loc)
+            if not link or spider.priority(link) != spider.PRIO_PRODUCT:
+                continue
+            prev = known.get(link)
+            if prev and prev.get("lastmod") == lastmod:
+                continue
+            updates.append((link, lastmod, now))
+            if seeding:
+                d = _parse_lastmod(lastmod)
+                if not d or d < cutoff:
+                    continue
+            found.append(link)
+
+    if updates:
+        store.executemany(
+            "INSERT OR REPLACE INTO sitemap(loc, lastmod, seen_at) VALUES (?, ?, ?)", updates
+        )
+    print(f"🗺️ Sitemap: {len(found)} prodotti nuovi o modificati ({len(done)} documenti)")
+    return found
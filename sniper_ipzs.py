@@ -1,24 +1,33 @@
 import requests
 from bs4 import BeautifulSoup
 import time
-import os
 from datetime import datetime, timedelta, date
-import pickle
 
 # riutilizziamo le tue funzioni già esistenti
 from utils import send
-from ipzs_flash import login_ipzs
-from mtm_flash import setup_driver_headless
+from ipzs_flash import (
+    login_ipzs,
+    add_to_cart_ipzs_http,
+    http_session_from_driver,
+    CART_ADDED,
+    CART_NOT_AVAIL,
+    CART_FAILED,
+)
+from browser_pool import pool, ipzs_key
+from queueit import park, in_queue, completed, QUEUED
+from metrics import metrics
+from session_vault import vault
+from http_cache import cache
+from state import open_store
+from revisit import RevisitScheduler
+from fetch import engine
+import extract
+import catalog
+from product import Availability
+import asyncio
 
 URL = "https://www.shop.ipzs.it/it/catalog/category/view/s/monete/id/3/"
 
-SEEN_FILE = "sniper_seen.json"
-FLASH_LOG_FILE = "ipzs_flash_log.json"
-COOKIE_FILE = "cookies_ipzs.pkl"
-STORAGE_FILE = "ipzs_storage.json"
-
-import json
-
 # Effettiva disponibilità prodotto - check con Selenium
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -29,34 +38,22 @@ import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+# Stato su SQLite (state.py): le viste sono dict-like e ogni scrittura è già
+# persistita; il "save" esporta i file JSON committati nel repo.
 def load_seen():
-    if not os.path.exists(SEEN_FILE):
-        return {}
-    try:
-        with open(SEEN_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except:
-        return {}
+    return open_store().sniper
 
 
 def save_seen(seen):
-    with open(SEEN_FILE, "w", encoding="utf-8") as f:
-        json.dump(seen, f, indent=2)
+    open_store().export()
 
 
 def load_flash_log():
-    if not os.path.exists(FLASH_LOG_FILE):
-        return {}
-    try:
-        with open(FLASH_LOG_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except:
-        return {}
+    return open_store().flash_log
 
 
 def save_flash_log(log):
-    with open(FLASH_LOG_FILE, "w", encoding="utf-8") as f:
-        json.dump(log, f, indent=2)
+    open_store().export()
 
 
 def flash_recently_triggered(log, link):
@@ -93,87 +90,9 @@ def should_check(link_data):
     return age > timedelta(hours=6)
 
 
-def save_cookies(driver):
-    with open(COOKIE_FILE, "wb") as file:
-        pickle.dump(driver.get_cookies(), file)
-    print("🍪 Cookie IPZS salvati")
-
-
-def save_storage(driver):
-    storage = {
-        "localStorage": driver.execute_script(
-            "return {...localStorage};"
-        ),
-        "sessionStorage": driver.execute_script(
-            "return {...sessionStorage};"
-        )
-    }
-    with open(STORAGE_FILE, "w", encoding="utf-8") as f:
-        json.dump(storage, f)
-    print("💾 Storage IPZS salvato")
-
-
-def load_cookies(driver):
-    if not os.path.exists(COOKIE_FILE):
-        return False
-    try:
-        driver.get("https://www.shop.ipzs.it")
-        with open(COOKIE_FILE, "rb") as file:
-
-            cookies = pickle.load(file)
-
-        for cookie in cookies:
-            try:
-                driver.add_cookie(cookie)
-            except:
-                pass
-
-        driver.refresh()
-        print("🍪 Cookie caricati")
-        return True
-
-    except Exception as e:
-        print(f"⚠️ Errore load cookies: {e}")
-        return False
-
-
-def load_storage(driver):
-    if not os.path.exists(STORAGE_FILE):
-        return False
-
-    try:
-        with open(STORAGE_FILE, "r", encoding="utf-8") as f:
-            storage = json.load(f)
-        driver.get("https://www.shop.ipzs.it")
-        for k, v in storage.get("localStorage", {}).items():
-            driver.execute_script(
-                "window.localStorage.setItem(arguments[0], arguments[1]);",
-                k,
-                v
-            )
-        for k, v in storage.get("sessionStorage", {}).items():
-            driver.execute_script(
-                "window.sessionStorage.setItem(arguments[0], arguments[1]);",
-                k,
-                v
-            )           
-        driver.refresh()
-        print("💾 Storage IPZS caricato")
-        return True
-
-    except Exception as e:
-        print(f"⚠️ Errore load storage: {e}")
-        return False
-
-
-def clear_session_files():
-    for file in [COOKIE_FILE, STORAGE_FILE]:
-        try:
-            if os.path.exists(file):
-                os.remove(file)
-                print(f"🧹 File sessione eliminato: {file}")
-        except Exception as e:
-            print(f"⚠️ Errore delete {file}: {e}")
+def save_session(driver):
+    # cookie + storage nel vault condiviso con il client HTTP (session_vault.py)
+    vault.from_driver(ipzs_key(), driver)
 
 
 def warm_session(driver):
@@ -189,11 +108,10 @@ def warm_session(driver):
 
             driver.get(page)
 
-            if "queue-it" in driver.current_url.lower():
-                print("⏳ Queue-it durante warm session")
-                WebDriverWait(driver, 120).until(
-                    lambda d: "queue-it" not in d.current_url.lower()
-                )
+            if in_queue(driver):
+                # niente attesa qui: i controlli successivi parcheggiano il driver
+                print("⏳ Queue-it durante warm session: salto il riscaldamento")
+                return False
 
             WebDriverWait(driver, 5).until(
                 EC.presence_of_element_located((By.TAG_NAME, "body"))
@@ -218,7 +136,11 @@ def get_links(retries=3):
     
     for attempt in range(retries):
         try:
-            r = requests.get(URL, headers=headers, timeout=10)
+            with metrics.phase("category_fetch"):
+                r = requests.get(
+                    URL, headers={**headers, **cache.validators(URL)}, timeout=10,
+                    hooks={"response": metrics.on_response},
+                )
             session = requests.Session()
             retry = Retry(
                 total=3,
@@ -229,6 +151,11 @@ def get_links(retries=3):
             session.mount("https://", adapter)
             session.mount("http://", adapter)
 
+            # 304 o listing identico → link già estratti al giro precedente
+            hit, cached = cache.lookup(URL, "sniper_links", r)
+            if hit:
+                return set(cached)
+
             if r.status_code != 200:
                 print(f"⚠️ Status code {r.status_code}")
                 time.sleep(2)
@@ -248,6 +175,8 @@ def get_links(retries=3):
 
                 links.add(href)
 
+            cache.store(URL, "sniper_links", r, sorted(links))
+            cache.save()
             return links
 
         except requests.exceptions.RequestException as e:
@@ -257,24 +186,17 @@ def get_links(retries=3):
     print("❌ IPZS non raggiungibile")
     return set()
 
+@metrics.timed("add_to_cart")
 def sniper_check_availability(driver, url, retries=3):
     for attempt in range(1, retries + 1):
         print(f"🔎 Tentativo sniper #{attempt}: {url}")
         try:
             driver.get(url)
 
-            # ───────── Queue-it detection
-            if "queue-it" in driver.current_url.lower():
+            # ───────── Queue-it detection: il driver viene parcheggiato e il controllo rilanciato all'uscita
+            if in_queue(driver):
                 print("⏳ Queue-it rilevato")
-                try:
-                    WebDriverWait(driver, 120).until(
-                        lambda d: "queue-it" not in d.current_url.lower()
-                    )
-                    print("✅ Uscito da Queue-it")
-                    driver.get(url)
-                except TimeoutException:
-                    print("❌ Timeout Queue-it")
-                    return "CART_FAILED"
+                return QUEUED
 
             # ───────── Attesa render pagina
             WebDriverWait(driver, 5).until(
@@ -356,7 +278,111 @@ def sniper_check_availability(driver, url, retries=3):
     return "NOT_AVAILABLE"
 
 
-def main():
+# ─────────── Probe stock HTTP (senza browser né login)
+# disponibilità dallo snapshot catalogo solo se più recente di così (solo nel daemon,
+# dove il giro IPZS lo rigenera ogni ~5 min nello stesso state store dello sniper)
+SNAPSHOT_MAX_AGE = timedelta(minutes=6)
+
+PROBE_NOT_AVAIL = "NOT_AVAILABLE"
+PROBE_BUYABLE   = "BUYABLE"
+PROBE_UNKNOWN   = "UNKNOWN"    # Queue-it / challenge / errore: decide il browser
+
+
+async def _probe(link):
+    try:
+        with metrics.phase("product_fetch"):
+            r = await engine.get(link)
+    except Exception as e:
+        print(f"⚠️ Probe fallito {link}: {e}")
+        return PROBE_UNKNOWN
+    if r.status_code in (404, 410):
+        return PROBE_NOT_AVAIL
+    if r.status_code != 200 or "queue-it" in r.url.lower():
+        return PROBE_UNKNOWN
+    if not extract.is_valid(r.content):
+        metrics.reject("invalid_page")
+        engine.blocked(link)
+        return PROBE_UNKNOWN
+    # stesso criterio del controllo Selenium sul page_source
+    if b"NON DISPONIBILE" in r.content.upper():
+        return PROBE_NOT_AVAIL
+    return PROBE_BUYABLE
+
+
+def probe_stock(links, known=None):
+    """
+    Stato di tutti i link: dallo snapshot catalogo se il prodotto c'è (`known`:
+    link → Product), altrimenti probe HTTP in parallelo sul motore condiviso.
+    """
+    known = known or {}
+    probes = {}
+    for link in links:
+        p = known.get(link)
+        if p is None or p.availability is Availability.UNKNOWN:
+            continue
+        probes[link] = PROBE_NOT_AVAIL if not p.available else PROBE_BUYABLE
+    missing = [l for l in links if l not in probes]
+
+    async def run():
+        return await asyncio.gather(*(_probe(l) for l in missing))
+    if missing:
+        probes.update(zip(missing, engine.run(run())))
+    return {l: probes[l] for l in links}
+
+
+
+# esito percorso HTTP → stato sniper
+HTTP_STATUS = {
+    CART_ADDED:     "AVAILABLE",
+    CART_NOT_AVAIL: "NOT_AVAILABLE",
+    CART_FAILED:    "CART_FAILED",
+}
+
+
+def sniper_cart(browser, http, url):
+    """
+    Add-to-cart HTTP diretto; il browser (`browser()`, avviato al primo uso)
+    interviene solo su Queue-it / challenge. Ritorna un Future con lo stato:
+    se il browser finisce in coda resta parcheggiato e il loop passa intanto
+    ai link successivi.
+    """
+    outcome = add_to_cart_ipzs_http(http, url)
+    if outcome in HTTP_STATUS:
+        return completed(HTTP_STATUS[outcome])
+    driver = browser()
+    if driver is None:
+        return completed("CART_FAILED")
+    return park.submit(
+        driver, lambda d: sniper_check_availability(d, url),
+        label=f"sniper {url.rsplit('/', 1)[-1]}", on_timeout="CART_FAILED",
+    )
+
+
+def sniper_login(driver):
+    """
+    Login per i driver del pool: login_ipzs ripristina la sessione dal vault
+    se ancora valida, altrimenti compila il form. Se fallisce la sessione
+    viene tolta dal vault e il pool riprova con un Chromium nuovo (recovery).
+    """
+    driver.execute_script("""
+    Object.defineProperty(navigator, 'webdriver', {get: () => undefined});
+    Object.defineProperty(navigator, 'languages', {get: () => ['it-IT', 'it']});
+    Object.defineProperty(navigator, 'plugins', {get: () => [1,2,3,4,5]});
+    """)
+
+    if login_ipzs(driver):
+        return True
+
+    print("⚠️ Login fallito → recovery con driver nuovo")
+    vault.invalidate(ipzs_key())
+    return False
+
+
+def main(use_snapshot=False):
+    """
+    Giro sniper. `use_snapshot` solo dal daemon: nel cron lo sniper ha il suo
+    state.db (cache bot-state-sniper-) e lo snapshot di main non gli arriva mai.
+    """
     print("🚀 SNIPER START", datetime.now())
 
     seen = load_seen()
@@ -367,99 +393,103 @@ def main():
         print("⚠️ Nessun link ottenuto")
         return
 
-    driver = None
+    # lo snapshot catalogo serve solo come stato di disponibilità: i link restano
+    # quelli del listing URL, e lo sniper non rifà lo sweep se lo snapshot è vecchio
+    known = {}
+    if use_snapshot:
+        snap = catalog.latest()
+        known = snap.by_link() if snap and snap.fresh(SNAPSHOT_MAX_AGE) else {}
 
-    for attempt in range(3):
-        try:
-            driver = setup_driver_headless()
-            driver.execute_script("""
-            Object.defineProperty(navigator, 'webdriver', {get: () => undefined});
-            Object.defineProperty(navigator, 'languages', {get: () => ['it-IT', 'it']});
-            Object.defineProperty(navigator, 'plugins', {get: () => [1,2,3,4,5]});
-            """)
-            break
-        except Exception as e:
-            print(f"⚠️ Chrome startup failed #{attempt+1}: {e}")
-            time.sleep(10)
-
-    if not driver:
-        send(
-            "<b>SNIPER IPZS</b>\n"
-            "Chrome startup fallito"
-        )
+    scheduler = RevisitScheduler()
+
+    def mark(link, status):
+        seen[link] = {
+            "status": status,
+            "last_check": datetime.now().isoformat()
+        }
+        scheduler.observe(link, status)
+
+    active = []
+    for link in current_links:
+        # cooldown business 30 giorni
+        if flash_recently_triggered(flash_log, link):
+            print(f"🧊 Cooldown flash attivo: {link}")
+            continue
+        active.append(link)
+
+    # intervallo di ricontrollo appreso per link + budget per run;
+    # i link mai schedulati seguono ancora la regola di should_check
+    eligible = scheduler.due(active, legacy=lambda link: should_check(seen.get(link, {})))
+    print(f"⏩ Skip intelligente: {len(active) - len(eligible)} link non ancora dovuti")
+
+    # stato dallo snapshot, probe HTTP solo per i link che non ci sono:
+    # il browser serve solo per i link che sembrano acquistabili
+    probes = probe_stock(eligible, known)
+    candidates = []
+    for link, probe in probes.items():
+        if probe == PROBE_NOT_AVAIL:
+            mark(link, "NOT_AVAILABLE")
+        else:
+            candidates.append(link)
+    print(f"🔎 Probe: {len(eligible)} link ({len(set(eligible) & set(known))} da snapshot), "
+          f"{len(candidates)} da verificare col browser")
+
+    if not candidates:
+        save_seen(seen)
+        print("✅ SNIPER END (nessun candidato, browser non avviato)", datetime.now())
         return
 
-    logged = False
-
-    # prova cookie
-    if load_cookies(driver):
-        load_storage(driver)
-        driver.get("https://www.shop.ipzs.it/it/customer/account/")
-
-        if (
-            "customer/account" in driver.current_url.lower()
-            and "login" not in driver.current_url.lower()
-        ):
-            print("✅ Sessione IPZS ripristinata via cookie")
-            logged = True
-
-    # fallback login classico
-    if not logged:
-        print("🔐 Sessione non valida → login classico")
-        logged = login_ipzs(driver)
-
-    if not logged:
-        print("⚠️ Primo login fallito → recovery")
-        driver.quit()
-        clear_session_files()
-        time.sleep(5)
-        driver = setup_driver_headless()
-        logged = login_ipzs(driver)
-
-        if not logged:
+    # Sessione valida nel vault → add-to-cart via HTTP senza browser; Chromium
+    # (già loggato dal pool, porta dinamica, retry di avvio interni) solo se serve
+    key = ipzs_key()
+    pooled = []
+
+    def browser():
+        if not pooled:
+            pooled.append(pool.acquire(key, sniper_login))
+            if pooled[0]:
+                warm_session(pooled[0].driver)
+                save_session(pooled[0].driver)
+        return pooled[0].driver if pooled[0] else None
+
+    http = vault.session(key)
+    if http is not None:
+        print("✅ Sessione IPZS valida dal vault: browser solo per Queue-it / challenge")
+    else:
+        driver = browser()
+        if driver is None:
             print("❌ Recovery login fallito")
             send(
                 "<b>SNIPER IPZS</b>\n"
-                "Recovery login IPZS fallito"
+                "Avvio Chrome o recovery login IPZS fallito"
             )
-            driver.quit()
             return
-
-        print("✅ Recovery login riuscito")
-
-    warm_session(driver)
-    save_cookies(driver)
-    save_storage(driver)
-    
+        http = http_session_from_driver(driver)
 
     triggered = []
 
-    for link in current_links:
-        # cooldown business 30 giorni
-        if flash_recently_triggered(flash_log, link):
-            print(f"🧊 Cooldown flash attivo: {link}")
-            continue
-            
-        link_data = seen.get(link, {})
-        
-        if not should_check(link_data):
-            print(f"⏩ Skip intelligente: {link}")
-            continue
-            
-        print(f"🚨 Controllo sniper: {link}")
-        status = sniper_check_availability(driver, link)
+    checks = []
+    for link in candidates:
+        print(f"🚨 Controllo sniper: {link} (probe: {probes[link]})")
+        checks.append((link, sniper_cart(browser, http, link)))
+
+    # attendo tutti gli esiti (anche quelli ripresi dopo Queue-it) prima di
+    # usare di nuovo il driver per salvare la sessione
+    results = []
+    for link, fut in checks:
+        try:
+            results.append((link, fut.result()))
+        except Exception as e:
+            print(f"⚠️ Errore sniper su {link}: {e}")
+            results.append((link, "CART_FAILED"))
 
+    for link, status in results:
         if status == "AVAILABLE":
             
             triggered.append(link)
-            seen[link] = {
-                "status": "AVAILABLE_CARTED",
-                "last_check": datetime.now().isoformat()
-            }
+            mark(link, "AVAILABLE_CARTED")
             update_flash_log(flash_log, link)
             save_flash_log(flash_log)
-            save_cookies(driver)
-            save_storage(driver)
             send(
                 f"<b>SNIPER IPZS</b>\n"
                 f"Moneta disponibile intercettata!\n\n"
@@ -467,17 +497,11 @@ def main():
             )
 
         elif status == "NOT_AVAILABLE":
-            seen[link] = {
-                "status": "NOT_AVAILABLE",
-                "last_check": datetime.now().isoformat()
-            }
+            mark(link, "NOT_AVAILABLE")
 
         elif status == "CART_FAILED":
             print("⚠️ Cart fallito ma prodotto disponibile")
-            seen[link] = {
-                "status": "CART_FAILED",
-                "last_check": datetime.now().isoformat()
-            }
+            mark(link, "CART_FAILED")
             update_flash_log(flash_log, link)
             save_flash_log(flash_log)
             send(
@@ -486,7 +510,10 @@ def main():
                 f"{link}"
             )
 
-    driver.quit()
+    vault.from_session(key, http)
+    if pooled and pooled[0]:
+        save_session(pooled[0].driver)
+        pool.release(key, pooled[0], healthy=pooled[0].alive())
 
     save_seen(seen)
     save_flash_log(flash_log)
@@ -498,3 +525,4 @@ def main():
 
 if __name__ == "__main__":
     main()
+    metrics.write("sniper")
@@ -0,0 +1,158 @@
+import re
+import time
+import asyncio
+import hashlib
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
+
+import extract
+from fetch import engine
+from metrics import metrics
+
+# ──────────────── Config spider catalogo
+DOMAIN      = "www.shop.ipzs.it"
+CONCURRENCY = 6          # pagine in volo (il motore limita comunque per host)
+HOST_BUDGET = 600        # pagine massime per host in un giro
+TIME_BUDGET = 90         # s di crawl per giro
+MAX_DEPTH   = 6
+
+# parametri che cambiano davvero il contenuto: paginazione e id categoria
+KEEP_PARAMS = {"p", "id", "cat"}
+
+SKIP_RE = re.compile(
+    r"/(customer|checkout|wishlist|sales|review|newsletter|contact|search|"
+    r"catalogsearch|product_compare|sendfriend|media|static)/|"
+    r"\.(jpe?g|png|gif|webp|svg|pdf|css|js|ico|zip)$",
+    re.I,
+)
+PRODUCT_VIEW_RE = re.compile(r"^(/\w+/catalog/product/view/id/\d+/).*")
+
+# priorità frontier: più bassa = prima
+PRIO_PRODUCT  = 0
+PRIO_CATEGORY = 1
+PRIO_PAGED    = 2
+PRIO_OTHER    = 3
+
+
+def normalize(href, base=None):
+    """
+    URL canonico per il crawl, o None se fuori catalogo: niente frammenti,
+    solo i parametri che cambiano la pagina (niente sort/limit/mode).
+    """
+    if not href or href.startswith(("javascript:", "mailto:", "tel:", "#")):
+        return None
+    parts = urlsplit(urljoin(base, href) if base else href)
+    if parts.hostname != DOMAIN or SKIP_RE.search(parts.path):
+        return None
+
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k in KEEP_PARAMS]
+    if ("p", "1") in query:
+        query.remove(("p", "1"))
+    return urlunsplit(("https", DOMAIN, parts.path, urlencode(sorted(query)), ""))
+
+
+def priority(url):
+    path = urlsplit(url).path
+    if "/catalog/product/view/" in path or (path.endswith(".html") and path.count("/") <= 2):
+        return PRIO_PRODUCT
+    if "/catalog/category/view/" in path or path.endswith(".html"):
+        return PRIO_PAGED if "p=" in urlsplit(url).query else PRIO_CATEGORY
+    return PRIO_OTHER
+
+
+def _key(url):
+    # visited compatto: 8 byte di hash al posto della stringa URL; gli alias
+    # .../product/view/id/N/s/<slug>/category/M/ contano come un solo prodotto
+    parts = urlsplit(url)
+    url = urlunsplit(parts._replace(path=PRODUCT_VIEW_RE.sub(r"\1", parts.path)))
+    return int.from_bytes(hashlib.blake2b(url.encode(), digest_size=8).digest(), "big")
+
+
+class Spider:
+    """
+    Crawl concorrente del catalogo: frontier a priorità (prodotti, poi categorie,
+    poi paginazione), URL canonici, visited compatto, budget di pagine per host
+    e di tempo per giro. I prodotti trovati vengono passati subito a `on_product`.
+    """
+
+    def __init__(self, on_product=None, concurrency=CONCURRENCY,
+                 host_budget=HOST_BUDGET, time_budget=TIME_BUDGET, max_depth=MAX_DEPTH):
+        self.on_product  = on_product
+        self.concurrency = concurrency
+        self.host_budget = host_budget
+        self.time_budget = time_budget
+        self.max_depth   = max_depth
+        self.visited  = set()
+        self.fetched  = {}
+        self.products = []
+        self.seq      = 0
+
+    def push(self, queue, url, depth):
+        k = _key(url)
+        if k in self.visited or depth > self.max_depth:
+            return
+        self.visited.add(k)
+        self.seq += 1
+        queue.put_nowait((priority(url), depth, self.seq, url))
+
+    async def fetch(self, url):
+        try:
+            r = await engine.get(url)
+            if r.status_code != 200:
+                return None
+            if not extract.is_valid(r.content):
+                print(f"⚠️ HTML sospetto su pagina catalogo: {url}")
+                metrics.reject("invalid_page")
+                engine.blocked(url)
+                return None
+            return await engine.to_thread(extract.page, r.content)
+        except Exception:
+            return None
+
+    async def worker(self, queue):
+        while True:
+            _, depth, _, url = await queue.get()
+            try:
+                host = urlsplit(url).hostname
+                if self.fetched.get(host, 0) >= self.host_budget:
+                    continue
+                self.fetched[host] = self.fetched.get(host, 0) + 1
+
+                page = await self.fetch(url)
+                if page is None:
+                    continue
+                is_product, hrefs = page
+                if is_product:
+                    self.products.append(url)
+                    if self.on_product:
+                        self.on_product(url)
+                    continue
+                for href in hrefs:
+                    nxt = normalize(href, base=url)
+                    if nxt:
+                        self.push(queue, nxt, depth + 1)
+            finally:
+                queue.task_done()
+
+    async def crawl(self, start):
+        queue = asyncio.PriorityQueue()
+        for url in start:
+            url = normalize(url)
+            if url:
+                self.push(queue, url, 0)
+
+        started = time.monotonic()
+        workers = [asyncio.create_task(self.worker(queue)) for _ in range(self.concurrency)]
+        try:
+            await asyncio.wait_for(queue.join(), self.time_budget)
+        except asyncio.TimeoutError:
+            print(f"⏱️ Spider: budget di {self.time_budget}s esaurito, {queue.qsize()} URL in coda")
+        finally:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        print(
+            f"🕷️ Spider: {sum(self.fetched.values())} pagine, {len(self.products)} prodotti "
+            f"in {time.monotonic() - started:.1f}s"
+        )
+        return self.products
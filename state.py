@@ -0,0 +1,404 @@
+import os
+import json
+import atexit
+import sqlite3
+import hashlib
+import threading
+from collections.abc import MutableMapping
+from datetime import datetime
+
+from metrics import metrics
+
+# ──────────────── Store di stato SQLite (WAL)
+DB_FILE = "state.db"
+
+# file storici: restano nel repo come export leggibile / diffabile
+SEEN_FILE       = "seen.txt"
+LOW_FILE        = "low_mintage_alerts.txt"
+MTM_SEEN_FILE   = "seen_mtm.txt"
+DATE_FILE       = "date_alerts.json"
+SPIDER_LOCK     = "last_spider.json"
+FLASH_LOG_FILE  = "ipzs_flash_log.json"
+SNIPER_FILE     = "sniper_seen.json"
+
+LINK_FILES = {
+    "new": SEEN_FILE,
+    "low": LOW_FILE,
+    "mtm": MTM_SEEN_FILE,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS links (
+    kind      TEXT NOT NULL,
+    link      TEXT NOT NULL,
+    added_at  TEXT NOT NULL,
+    PRIMARY KEY (kind, link)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS flash_log (
+    link        TEXT PRIMARY KEY,
+    flashed_on  TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS date_alerts (
+    release_date  TEXT PRIMARY KEY,
+    alerted_on    TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS sniper (
+    link        TEXT PRIMARY KEY,
+    status      TEXT,
+    last_check  TEXT
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS listing (
+    link        TEXT PRIMARY KEY,
+    signature   TEXT NOT NULL,
+    scraped_at  TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS sitemap (
+    loc       TEXT PRIMARY KEY,
+    lastmod   TEXT,
+    seen_at   TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS revisit (
+    link         TEXT PRIMARY KEY,
+    interval     REAL NOT NULL,
+    next_due     TEXT NOT NULL,
+    last_status  TEXT,
+    last_change  TEXT,
+    checks       INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS outbox (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    header      TEXT,
+    body        TEXT NOT NULL,
+    created_at  TEXT NOT NULL,
+    attempts    INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS catalog (
+    version   INTEGER PRIMARY KEY AUTOINCREMENT,
+    taken_at  TEXT NOT NULL,
+    source    TEXT NOT NULL,
+    products  TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key    TEXT PRIMARY KEY,
+    value  TEXT
+) WITHOUT ROWID;
+"""
+
+
+def _file_hash(fp):
+    if not os.path.exists(fp):
+        return ""
+    with open(fp, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _read_json(fp):
+    if not os.path.exists(fp):
+        return {}
+    try:
+        with open(fp, encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except json.JSONDecodeError:
+        print(f"⚠️ Il file {fp} è corrotto o vuoto, verrà ignorato.")
+        return {}
+
+
+def _write_atomic(fp, text):
+    tmp = fp + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, fp)
+
+
+class LinkSet:
+    """Vista set-like su links(kind): lookup indicizzato e insert incrementale."""
+
+    def __init__(self, store, kind):
+        self.store = store
+        self.kind  = kind
+
+    def __contains__(self, link):
+        return self.store.query_one(
+            "SELECT 1 FROM links WHERE kind=? AND link=?", (self.kind, link)
+        ) is not None
+
+    def add(self, link):
+        self.store.execute(
+            "INSERT OR IGNORE INTO links(kind, link, added_at) VALUES (?, ?, ?)",
+            (self.kind, link, datetime.now().isoformat(timespec="seconds")),
+            table=f"links:{self.kind}",
+        )
+
+    def discard(self, link):
+        self.store.execute(
+            "DELETE FROM links WHERE kind=? AND link=?", (self.kind, link),
+            table=f"links:{self.kind}",
+        )
+
+    def __iter__(self):
+        rows = self.store.query("SELECT link FROM links WHERE kind=? ORDER BY link", (self.kind,))
+        return iter([r[0] for r in rows])
+
+    def __len__(self):
+        return self.store.query_one("SELECT COUNT(*) FROM links WHERE kind=?", (self.kind,))[0]
+
+
+class TableView(MutableMapping):
+    """
+    Vista dict-like su una tabella tipizzata. Con una sola colonna valore
+    restituisce lo scalare, altrimenti un dict colonna → valore.
+    """
+
+    def __init__(self, store, table, key, columns):
+        self.store   = store
+        self.table   = table
+        self.key     = key
+        self.columns = columns
+
+    def _row(self, row):
+        if len(self.columns) == 1:
+            return row[0]
+        return {c: v for c, v in zip(self.columns, row) if v is not None}
+
+    def __getitem__(self, k):
+        row = self.store.query_one(
+            f"SELECT {', '.join(self.columns)} FROM {self.table} WHERE {self.key}=?", (k,)
+        )
+        if row is None:
+            raise KeyError(k)
+        return self._row(row)
+
+    def __setitem__(self, k, value):
+        values = [value] if len(self.columns) == 1 else [value.get(c) for c in self.columns]
+        cols = ", ".join([self.key] + self.columns)
+        marks = ", ".join("?" * (len(self.columns) + 1))
+        self.store.execute(
+            f"INSERT OR REPLACE INTO {self.table}({cols}) VALUES ({marks})",
+            [k] + values,
+            table=self.table,
+        )
+
+    def __delitem__(self, k):
+        self.store.execute(f"DELETE FROM {self.table} WHERE {self.key}=?", (k,), table=self.table)
+
+    def __iter__(self):
+        rows = self.store.query(f"SELECT {self.key} FROM {self.table} ORDER BY {self.key}")
+        return iter([r[0] for r in rows])
+
+    def __len__(self):
+        return self.store.query_one(f"SELECT COUNT(*) FROM {self.table}")[0]
+
+    def items(self):
+        rows = self.store.query(
+            f"SELECT {self.key}, {', '.join(self.columns)} FROM {self.table} ORDER BY {self.key}"
+        )
+        return [(r[0], self._row(r[1:])) for r in rows]
+
+
+class StateStore:
+    """
+    Stato del bot in un unico SQLite (WAL, autocommit): ogni modifica è un
+    upsert di una riga, quindi un crash a metà run non lascia file troncati.
+    I vecchi file .txt/.json restano come formato di import/export.
+    """
+
+    def __init__(self, path=DB_FILE):
+        self.path  = path
+        self.lock  = threading.Lock()
+        self.dirty = set()
+        self.conn  = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+        self.flash_log   = TableView(self, "flash_log", "link", ["flashed_on"])
+        self.date_alerts = TableView(self, "date_alerts", "release_date", ["alerted_on"])
+        self.sniper      = TableView(self, "sniper", "link", ["status", "last_check"])
+        self.meta        = TableView(self, "meta", "key", ["value"])
+        # firma del listing categoria per prodotto (non esportata: è una cache)
+        self.listing     = TableView(self, "listing", "link", ["signature", "scraped_at"])
+        # <lastmod> visti nelle sitemap, per URL e per sitemap figlia (non esportata)
+        self.sitemap     = TableView(self, "sitemap", "loc", ["lastmod", "seen_at"])
+        # scheduler dei ricontrolli sniper per link (non esportata)
+        self.revisit     = TableView(
+            self, "revisit", "link", ["interval", "next_due", "last_status", "last_change", "checks"]
+        )
+
+    # ─────────── Accesso base
+    def execute(self, sql, params=(), table=None):
+        with self.lock:
+            self.conn.execute(sql, params)
+            if table:
+                self.dirty.add(table)
+
+    def executemany(self, sql, rows, table=None):
+        # una sola transazione: migliaia di upsert senza un commit ciascuno
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(sql, rows)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            if table:
+                self.dirty.add(table)
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def query_one(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchone()
+
+    def links(self, kind):
+        return LinkSet(self, kind)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    # ─────────── Import dai file storici
+    def sync_legacy(self):
+        """
+        Importa (merge) ogni file storico cambiato dall'ultimo import/export,
+        es. perché un altro workflow lo ha committato. Idempotente.
+        """
+        for kind, fp in LINK_FILES.items():
+            self._sync_file(fp, lambda fp=fp, kind=kind: self._import_links(kind, fp))
+        self._sync_file(DATE_FILE,      lambda: self._import_date_alerts())
+        self._sync_file(SPIDER_LOCK,    lambda: self._import_spider_lock())
+        self._sync_file(FLASH_LOG_FILE, lambda: self._import_flash_log())
+        self._sync_file(SNIPER_FILE,    lambda: self._import_sniper())
+
+    def _sync_file(self, fp, importer):
+        h = _file_hash(fp)
+        if not h or self.meta.get(f"hash:{fp}") == h:
+            return
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                importer_rows = importer()
+                for sql, rows in importer_rows:
+                    self.conn.executemany(sql, rows)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", (f"hash:{fp}", h)
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        print(f"📥 Stato importato da {fp}")
+
+    def _import_links(self, kind, fp):
+        with open(fp, encoding="utf-8") as f:
+            links = {l.strip() for l in f if l.strip()}
+        now = datetime.now().isoformat(timespec="seconds")
+        return [(
+            "INSERT OR IGNORE INTO links(kind, link, added_at) VALUES (?, ?, ?)",
+            [(kind, l, now) for l in links],
+        )]
+
+    def _import_date_alerts(self):
+        return [(
+            "INSERT OR REPLACE INTO date_alerts(release_date, alerted_on) VALUES (?, ?)",
+            [(k, str(v)) for k, v in _read_json(DATE_FILE).items()],
+        )]
+
+    def _import_spider_lock(self):
+        ts = _read_json(SPIDER_LOCK).get("ts")
+        if not ts:
+            return []
+        return [(
+            "INSERT INTO meta(key, value) VALUES ('spider_ts', ?) "
+            "ON CONFLICT(key) DO UPDATE SET value=MAX(value, excluded.value)",
+            [(ts,)],
+        )]
+
+    def _import_flash_log(self):
+        return [(
+            "INSERT INTO flash_log(link, flashed_on) VALUES (?, ?) "
+            "ON CONFLICT(link) DO UPDATE SET flashed_on=MAX(flashed_on, excluded.flashed_on)",
+            [(k, str(v)) for k, v in _read_json(FLASH_LOG_FILE).items()],
+        )]
+
+    def _import_sniper(self):
+        rows = []
+        for link, d in _read_json(SNIPER_FILE).items():
+            if isinstance(d, dict):
+                rows.append((link, d.get("status"), d.get("last_check")))
+        return [(
+            "INSERT INTO sniper(link, status, last_check) VALUES (?, ?, ?) "
+            "ON CONFLICT(link) DO UPDATE SET status=excluded.status, last_check=excluded.last_check "
+            "WHERE COALESCE(excluded.last_check, '') > COALESCE(sniper.last_check, '')",
+            rows,
+        )]
+
+    # ─────────── Export leggibile per il repo
+    @metrics.timed("state_save")
+    def export(self, force=False):
+        """
+        Riscrive (ordinati, atomici) solo i file delle tabelle modificate
+        in questo run, e ne registra l'hash per non reimportarli.
+        """
+        written = []
+        for kind, fp in LINK_FILES.items():
+            if force or f"links:{kind}" in self.dirty:
+                _write_atomic(fp, "\n".join(self.links(kind)))
+                written.append(fp)
+        if force or "date_alerts" in self.dirty:
+            _write_atomic(DATE_FILE, json.dumps(dict(self.date_alerts.items()), indent=2))
+            written.append(DATE_FILE)
+        if (force or "meta" in self.dirty) and self.meta.get("spider_ts"):
+            _write_atomic(SPIDER_LOCK, json.dumps({"ts": self.meta["spider_ts"]}, indent=2))
+            written.append(SPIDER_LOCK)
+        if force or "flash_log" in self.dirty:
+            _write_atomic(FLASH_LOG_FILE, json.dumps(dict(self.flash_log.items()), indent=2))
+            written.append(FLASH_LOG_FILE)
+        if force or "sniper" in self.dirty:
+            _write_atomic(SNIPER_FILE, json.dumps(dict(self.sniper.items()), indent=2))
+            written.append(SNIPER_FILE)
+
+        for fp in written:
+            self.meta[f"hash:{fp}"] = _file_hash(fp)
+        self.dirty.clear()
+        return written
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def open_store(path=DB_FILE):
+    """Store condiviso del processo, sincronizzato con i file storici all'apertura."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = StateStore(path)
+            _store.sync_legacy()
+            atexit.register(_store.close)
+        return _store
+
+
+if __name__ == "__main__":
+    import sys
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "import":
+        open_store()
+        print("✅ Import completato")
+    elif cmd == "export":
+        print(f"💾 Esportati: {open_store().export(force=True)}")
+    else:
+        print("Usage: python state.py import|export")
+        sys.exit(1)
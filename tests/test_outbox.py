@@ -0,0 +1,106 @@
+import time
+from collections import Counter
+
+import pytest
+
+import utils
+from state import StateStore
+from utils import Outbox, pack, MAX_LEN
+
+
+def rows_of(*messages):
+    return [(i, header, body) for i, (header, body) in enumerate(messages, 1)]
+
+
+def test_oversized_body_is_split_within_limit():
+    body = "\n".join(f"riga {i:05d} " + "x" * 80 for i in range(120))   # ~11k caratteri
+    assert len(body) > MAX_LEN
+
+    messages = pack(rows_of(("<b>Header</b>", body)))
+    assert len(messages) > 1
+    assert all(len(text) <= MAX_LEN for text, _ in messages)
+    # tagli a fine riga: nessuna riga persa o spezzata
+    lines = [l for text, _ in messages for l in text.split("\n") if l.startswith("riga")]
+    assert lines == body.split("\n")
+    # il body si conferma con l'ultimo pezzo
+    assert [ids for _, ids in messages] == [[]] * (len(messages) - 1) + [[1]]
+
+
+def test_oversized_body_without_newlines_is_cut_at_limit():
+    messages = pack(rows_of((None, "y" * (2 * MAX_LEN + 10))))
+    assert [len(text) for text, _ in messages] == [MAX_LEN, MAX_LEN, 10]
+
+
+def test_header_is_repeated_on_every_piece_of_its_group():
+    header = "<b>Nuovi prodotti</b>"
+    bodies = [f"prodotto {i} " + "z" * 1500 for i in range(6)]
+    messages = pack(rows_of(*[(header, b) for b in bodies], ("<b>Altro</b>", "solo")))
+
+    grouped = [text for text, _ in messages if header in text]
+    assert len(grouped) > 1
+    assert all(text.startswith(header + "\n") and text.count(header) == 1 for text in grouped)
+    # ogni body del gruppo sta sotto la sua intestazione, una volta sola
+    assert Counter(b for text in grouped for b in bodies if b in text) == Counter(bodies)
+    assert any(text.endswith("<b>Altro</b>\nsolo") for text, _ in messages)
+
+
+def test_every_id_is_in_exactly_one_message():
+    rows = rows_of(
+        ("<b>A</b>", "uno"), ("<b>A</b>", "uno"),          # duplicato nella raffica
+        ("<b>B</b>", "w" * 5000),                          # body spezzato
+        (None, "senza header"), (None, "senza header"),
+        *[("<b>C</b>", f"c{i} " + "v" * 900) for i in range(10)],
+    )
+    messages = pack(rows)
+
+    ids = Counter(i for _, msg_ids in messages for i in msg_ids)
+    assert ids == Counter(r[0] for r in rows)
+    # ogni id sta sul messaggio che contiene il suo body
+    bodies = {i: body for i, _, body in rows}
+    for text, msg_ids in messages:
+        for i in msg_ids:
+            assert bodies[i][-50:] in text
+
+
+@pytest.fixture
+def outbox(monkeypatch):
+    store = StateStore(":memory:")
+    ob = Outbox()
+    monkeypatch.setattr(ob, "_store", lambda: store)
+    monkeypatch.setattr(utils, "LINGER", 0)
+    monkeypatch.setattr(utils.atexit, "register", lambda fn: None)
+    monkeypatch.setenv("TELEGRAM_TOKEN", "t")
+    monkeypatch.setenv("CHAT_ID", "c")
+    return ob, store
+
+
+def test_flush_confirms_only_the_ids_of_sent_messages(outbox):
+    ob, store = outbox
+    for header, body in [("<b>A</b>", "a" * 3000), ("<b>A</b>", "b" * 3000),
+                         ("<b>B</b>", "c" * 3000), (None, "d" * 3000)]:
+        store.execute(
+            "INSERT INTO outbox(header, body, created_at) VALUES (?, ?, '2026-01-01')", (header, body)
+        )
+    rows = store.query("SELECT id, header, body FROM outbox ORDER BY id")
+    messages = pack(rows)
+    assert len(messages) == 4
+
+    sent = []
+
+    def post(text):
+        if len(sent) < 2:
+            sent.append(text)
+            return "ok"
+        # Telegram smette di rispondere: il resto resta in coda
+        ob.not_before = time.monotonic() + 3600
+        return "retry"
+
+    ob._post = post
+    ob.start()
+    assert ob.flush(timeout=2) is False
+
+    confirmed = {i for _, ids in messages[:2] for i in ids}
+    left = {r[0] for r in store.query("SELECT id FROM outbox")}
+    assert sent == [text for text, _ in messages[:2]]
+    assert left == {r[0] for r in rows} - confirmed
+    assert store.query_one("SELECT MIN(attempts) FROM outbox")[0] == 1
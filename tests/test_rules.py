@@ -0,0 +1,45 @@
+import os
+import json
+
+import pytest
+
+from rules import RuleSet, ACTION_CART
+
+
+def write(path, content, mtime):
+    path.write_text(content, encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def rules_file(tmp_path):
+    path = tmp_path / "flash_rules.json"
+    write(path, json.dumps([{"name": "R1", "max_tiratura": 500, "action": ACTION_CART}]), 1000)
+    return path
+
+
+@pytest.mark.parametrize("content", [
+    '[{"name": "R2", "max_tiratura": ',                  # JSON troncato
+    '[{"name": "R2", "azione": "cart"}]',                 # campo sconosciuto
+    '[{"name": "R2", "action": "buy"}]',                  # azione non valida
+    '[{"name": "R2", "keywords": [[1, 2]]}]',             # keyword non stringa
+    '{"name": "R2"}',                                     # non è una lista di regole
+])
+def test_malformed_file_keeps_previous_rules(rules_file, content):
+    rs = RuleSet(rules_file)
+    assert [r.name for r in rs.rules] == ["R1"]
+
+    write(rules_file, content, 2000)
+    rs.refresh()
+    assert [r.name for r in rs.rules] == ["R1"]
+    assert rs.evaluate([100], [10.0], ["moneta"])[0].name == "R1"
+
+
+def test_fixed_file_is_reloaded(rules_file):
+    rs = RuleSet(rules_file)
+    write(rules_file, "[", 2000)
+    rs.refresh()
+
+    write(rules_file, json.dumps([{"name": "R2", "max_prezzo": 50}]), 3000)
+    rs.refresh()
+    assert [r.name for r in rs.rules] == ["R2"]
@@ -1,29 +1,224 @@
 import os
+import time
+import atexit
 import requests
 import threading
+from datetime import datetime
 
 file_lock = threading.Lock()
 
-def send(text: str) -> bool:
-    token = os.getenv("TELEGRAM_TOKEN")
-    chat  = os.getenv("CHAT_ID")
+# ──────────────── Outbox Telegram
+API_URL      = "https://api.telegram.org/bot{token}/sendMessage"
+MAX_LEN      = 4096   # limite caratteri di un messaggio Telegram
+LINGER       = 1.5    # s di attesa per raccogliere una raffica in un digest
+MAX_ATTEMPTS = 20     # oltre, il messaggio viene scartato
+MAX_BACKOFF  = 300
+FLUSH_TIMEOUT = 30    # s concessi all'uscita del processo per svuotare la coda
 
-    if not token or not chat:
-        return False
 
-    try:
-        r = requests.post(
-            f"https://api.telegram.org/bot{token}/sendMessage",
-            data={
-                "chat_id": chat,
-                "text": text,
-                "parse_mode": "HTML"
-            },
-            timeout=10
+def _split(text, limit=MAX_LEN):
+    # taglia a fine riga quando possibile
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    chunks.append(text)
+    return chunks
+
+
+def pack(rows, limit=MAX_LEN):
+    """
+    Raggruppa i messaggi in coda (id, header, body) in digest ≤ limit:
+    i body con lo stesso header finiscono sotto un'unica intestazione,
+    i duplicati nella stessa raffica vengono inviati una volta sola.
+    Ritorna [(testo, [id, ...])]: ogni id sta sul messaggio che porta il suo body.
+    """
+    groups = {}   # header (o id per i messaggi senza header) → [header, {body: [id, ...]}]
+    for id_, header, body in rows:
+        g = groups.setdefault(header or id_, [header, {}])
+        g[1].setdefault(body, []).append(id_)
+
+    pieces = []   # (testo, id dei body contenuti); oltre limit solo un body gigante
+    for header, bodies in groups.values():
+        prefix = f"{header}\n" if header else ""
+        text, ids = prefix, []
+        for body, body_ids in bodies.items():
+            sep = "\n\n" if text != prefix else ""
+            if text != prefix and len(text) + len(sep) + len(body) > limit:
+                pieces.append((text, ids))
+                text, ids, sep = prefix, [], ""
+            text += sep + body
+            ids = ids + body_ids
+        pieces.append((text, ids))
+
+    messages = []
+    for text, ids in pieces:
+        for chunk in _split(text, limit):
+            if messages and len(messages[-1][0]) + 2 + len(chunk) <= limit:
+                messages[-1] = (messages[-1][0] + "\n\n" + chunk, messages[-1][1])
+            else:
+                messages.append((chunk, []))
+        # un body spezzato su più messaggi si conferma con l'ultimo pezzo
+        messages[-1][1].extend(ids)
+    return messages
+
+
+class Outbox:
+    """
+    Coda persistente (tabella outbox di state.db) svuotata da un thread in
+    background su una connessione keep-alive: chi notifica non aspetta mai
+    Telegram, le raffiche diventano digest, i 429 rispettano retry_after e
+    ciò che non parte resta in coda per il run successivo.
+    """
+
+    def __init__(self):
+        self.cond       = threading.Condition()
+        self.thread     = None
+        self.session    = None
+        self.not_before = 0.0
+        self.busy       = False
+
+    def _store(self):
+        from state import open_store
+        return open_store()
+
+    def put(self, body, header=None):
+        self._store().execute(
+            "INSERT INTO outbox(header, body, created_at) VALUES (?, ?, ?)",
+            (header, body, datetime.now().isoformat(timespec="seconds")),
         )
+        self.start()
+        with self.cond:
+            self.cond.notify_all()
+
+    def pending(self):
+        return self._store().query_one("SELECT COUNT(*) FROM outbox")[0]
+
+    def start(self):
+        """Avvia il sender (recupera anche i messaggi rimasti dai run precedenti)."""
+        if not os.getenv("TELEGRAM_TOKEN") or not os.getenv("CHAT_ID"):
+            return
+        with self.cond:
+            if self.thread is None:
+                self._store()
+                self.session = requests.Session()
+                self.thread = threading.Thread(target=self._worker, name="outbox", daemon=True)
+                self.thread.start()
+                # registrato dopo lo store: all'uscita si svuota prima della close
+                atexit.register(self.flush)
 
-        r.raise_for_status()
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        """Attende che la coda si svuoti (o il timeout). True se vuota."""
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            self.cond.notify_all()
+            while self.busy or self.pending():
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    print(f"📮 Outbox: {self.pending()} messaggi restano in coda per il prossimo run")
+                    return False
+                self.cond.wait(min(left, 0.5))
         return True
 
-    except:
+    # ─────────── Sender
+    def _worker(self):
+        while True:
+            with self.cond:
+                while not self.pending():
+                    self.cond.wait(5)
+                self.busy = True
+            try:
+                wait = self.not_before - time.monotonic()
+                time.sleep(max(wait, LINGER))
+                self._drain()
+            except Exception as e:
+                print(f"⚠️ Outbox errore: {e}")
+                self.not_before = time.monotonic() + 5
+            finally:
+                with self.cond:
+                    self.busy = False
+                    self.cond.notify_all()
+
+    def _drain(self):
+        store = self._store()
+        rows = store.query("SELECT id, header, body FROM outbox ORDER BY id")
+        for text, ids in pack(rows):
+            outcome = self._post(text)
+            if outcome == "retry":
+                # i messaggi già partiti sono stati tolti dalla coda uno per uno;
+                # questo e i successivi ritentano più tardi
+                store.execute("UPDATE outbox SET attempts = attempts + 1")
+                store.execute("DELETE FROM outbox WHERE attempts >= ?", (MAX_ATTEMPTS,))
+                return
+            if ids:
+                marks = ",".join("?" * len(ids))
+                store.execute(f"DELETE FROM outbox WHERE id IN ({marks})", ids)
+
+    def _post(self, text):
+        token = os.getenv("TELEGRAM_TOKEN")
+        chat  = os.getenv("CHAT_ID")
+        try:
+            r = self.session.post(
+                API_URL.format(token=token),
+                data={
+                    "chat_id": chat,
+                    "text": text,
+                    "parse_mode": "HTML"
+                },
+                timeout=10
+            )
+        except requests.RequestException as e:
+            return self._backoff(f"rete: {e}")
+
+        if r.status_code == 429:
+            try:
+                retry_after = int(r.json()["parameters"]["retry_after"])
+            except Exception:
+                retry_after = int(r.headers.get("Retry-After", 5))
+            print(f"⏳ Telegram 429: riprovo tra {retry_after}s")
+            self.not_before = time.monotonic() + retry_after
+            return "retry"
+        if r.status_code >= 500:
+            return self._backoff(f"status {r.status_code}")
+        if r.status_code != 200:
+            # 400/403: il messaggio non partirà mai, inutile ritentare
+            print(f"❌ Telegram {r.status_code}: messaggio scartato ({r.text[:200]})")
+            return "drop"
+        return "ok"
+
+    def _backoff(self, reason):
+        attempts = self._store().query_one("SELECT MAX(attempts) FROM outbox")[0] or 0
+        delay = min(MAX_BACKOFF, 2 ** attempts)
+        print(f"⚠️ Telegram non raggiungibile ({reason}): riprovo tra {delay}s")
+        self.not_before = time.monotonic() + delay
+        return "retry"
+
+
+outbox = Outbox()
+
+
+def send(text: str, header: str = None) -> bool:
+    """
+    Accoda un messaggio Telegram (HTML) e ritorna subito: True se accodato.
+    Messaggi con lo stesso `header` ravvicinati vengono uniti in un digest.
+    """
+    if not os.getenv("TELEGRAM_TOKEN") or not os.getenv("CHAT_ID"):
         return False
+
+    outbox.put(text, header)
+    return True
+
+
+def sunday_ping():
+    n = datetime.now()
+    if n.weekday()==6 and n.hour==11:
+        # una sola notifica per domenica anche con più run nella stessa ora
+        from state import open_store
+        meta = open_store().meta
+        if meta.get("sunday_ping") == str(n.date()):
+            return
+        if send("🔁 Check domenicale: bot attivo"):
+            meta["sunday_ping"] = str(n.date())